@@ -1,11 +1,16 @@
-from django.contrib import admin
+import os
+import subprocess
+import sys
+import threading
+
+from django.contrib import admin, messages
 from django import forms
 from django.conf import settings
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.template.defaultfilters import linebreaksbr
 
-from dashboard.common.db_util import canvas_id_to_incremented_id
+from dashboard.common.db_util import COURSE_REFRESH_LOG_CODE, canvas_id_to_incremented_id
 from .models import CourseViewOption, Course
 
 from django.forms.models import ModelForm
@@ -52,6 +57,7 @@ class CourseAdmin(admin.ModelAdmin):
     list_display = ('canvas_id', 'name', 'term', 'show_grade_counts', 'course_link', '_courseviewoption', 'show_grade_type')
     list_select_related = True
     readonly_fields = ('term',)
+    actions = ['refresh_course_data']
 
     # Need this method to correctly display the line breaks
     def _courseviewoption(self, obj):
@@ -66,5 +72,24 @@ def save_model(self, request, obj, form, change):
         obj.id = canvas_id_to_incremented_id(obj.canvas_id)
         return super(CourseAdmin, self).save_model(request, obj, form, change)
 
+    # Reload the data of the selected courses from the data warehouse without waiting for the next cron run.
+    # The refresh takes longer than a request may, so the refresh_course command runs it in its own process,
+    # which logs the result as a cron job log. A daemon thread waits for the process so it is reaped when it exits
+    # instead of staying a zombie of the web server
+    def refresh_course_data(self, request, queryset):
+        canvas_ids = [str(canvas_id) for canvas_id in queryset.values_list('canvas_id', flat=True)]
+        command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'refresh_course',
+                   '--course_id', *canvas_ids]
+        try:
+            process = subprocess.Popen(command, start_new_session=True)
+        except OSError as e:
+            self.message_user(request, f"Starting the refresh of {len(canvas_ids)} course(s) failed: {e}",
+                              messages.ERROR)
+            return
+        threading.Thread(target=process.wait, name=f"refresh_course {process.pid}", daemon=True).start()
+        self.message_user(request, f"Started refreshing the data of {len(canvas_ids)} course(s). The result is logged "
+                                   f"in the cron job logs under {COURSE_REFRESH_LOG_CODE}.", messages.SUCCESS)
+    refresh_course_data.short_description = "Refresh course data from the data warehouse"
+
 
 admin.site.register(Course, CourseAdmin)
@@ -2,15 +2,75 @@
 
 import django
 import logging
+import threading
 from datetime import datetime
 from dateutil.parser import parse
 
 from django_cron.models import CronJobLog
 import pandas as pd
 from django.conf import settings
+from django.db import connections
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import URL
 
 logger = logging.getLogger(__name__)
 
+# SQLAlchemy drivers of the Django database vendors
+SQLALCHEMY_DRIVERS = {
+    'mysql': 'mysql+mysqldb',
+    'postgresql': 'postgresql+psycopg2',
+    'sqlite': 'sqlite',
+}
+
+# pooled SQLAlchemy engines by Django database alias and whether they are loader engines, created on first use
+engines = {}
+engines_lock = threading.Lock()
+
+
+def create_database_engine(alias, loader=False):
+    """Creates a pooled SQLAlchemy engine for a database of settings.DATABASES
+
+    :param alias: Django database alias, e.g. default or DATA_WAREHOUSE
+    :type alias: str
+    :param loader: enable the client side of LOAD DATA LOCAL INFILE on the connections, for the cron loader only
+    :type loader: bool
+    :rtype: sqlalchemy.engine.Engine
+    """
+    database = settings.DATABASES[alias]
+    vendor = connections[alias].vendor
+    query = {}
+    connect_args = {}
+    if vendor == 'mysql':
+        query['charset'] = 'utf8mb4'
+        if loader:
+            connect_args['local_infile'] = 1
+    url = URL(SQLALCHEMY_DRIVERS[vendor], username=database.get('USER') or None,
+              password=database.get('PASSWORD') or None, host=database.get('HOST') or None,
+              port=database.get('PORT') or None, database=database.get('NAME'), query=query)
+
+    if vendor == 'sqlite':
+        return create_engine(url)
+    logger.debug(f"creating a pool of {settings.DB_POOL_SIZE} {'loader ' if loader else ''}connections "
+                 f"to database {alias}")
+    return create_engine(url, connect_args=connect_args, pool_size=settings.DB_POOL_SIZE,
+                         pool_pre_ping=settings.DB_POOL_PRE_PING, pool_recycle=settings.DB_POOL_RECYCLE)
+
+
+def get_engine(alias='default', loader=False):
+    """Returns the pooled SQLAlchemy engine of a database, shared by the cron job, the views and the management commands
+
+    :param alias: Django database alias, e.g. default or DATA_WAREHOUSE
+    :type alias: str
+    :param loader: return the separate engine whose connections may run LOAD DATA LOCAL INFILE, used only by the
+        load_data backend of the cron job
+    :type loader: bool
+    :rtype: sqlalchemy.engine.Engine
+    """
+    with engines_lock:
+        if (alias, loader) not in engines:
+            engines[(alias, loader)] = create_database_engine(alias, loader)
+        return engines[(alias, loader)]
+
 
 def canvas_id_to_incremented_id(canvas_id):
     try:
@@ -57,14 +117,17 @@ def get_course_view_options (course_id):
     course_view_option = ""
     if (course_id):
         with django.db.connection.cursor() as cursor:
-            cursor.execute("SELECT show_resources_accessed, show_assignment_planning_v1, show_assignment_planning, show_grade_distribution FROM course_view_option WHERE course_id = %s", [course_id])
+            cursor.execute("SELECT show_resources_accessed, show_assignment_planning_v1, show_assignment_planning, "
+                           "show_grade_distribution FROM course_view_option WHERE course_id = %s", [course_id])
             row = cursor.fetchone()
             if (row != None):
-                course_view_option = {}
-                course_view_option['show_resources_accessed'] = row[0] and 'show_resources_accessed' not in settings.VIEWS_DISABLED
-                course_view_option['show_assignment_planning_v1'] = row[1] and 'show_assignment_planning' not in settings.VIEWS_DISABLED
-                course_view_option['show_assignment_planning'] = row[1] and 'show_assignment_planning' not in settings.VIEWS_DISABLED
-                course_view_option['show_grade_distribution'] = row[2] and 'show_grade_distribution' not in settings.VIEWS_DISABLED
+                views_disabled = settings.VIEWS_DISABLED
+                course_view_option = {
+                    'show_resources_accessed': row[0] and 'show_resources_accessed' not in views_disabled,
+                    'show_assignment_planning_v1': row[1] and 'show_assignment_planning' not in views_disabled,
+                    'show_assignment_planning': row[1] and 'show_assignment_planning' not in views_disabled,
+                    'show_grade_distribution': row[2] and 'show_grade_distribution' not in views_disabled,
+                }
     return course_view_option
 
 
@@ -108,9 +171,14 @@ def get_user_courses_info(username):
     return course_info
 
 
+# code of the cron job logs recorded by the refresh_course command
+COURSE_REFRESH_LOG_CODE = 'dashboard.refresh_course'
+
+
 def get_last_cron_run():
     try:
-        c = CronJobLog.objects.filter(is_success=1).latest('end_time')
+        # a course refresh only updates some courses, so it does not count as a cron run
+        c = CronJobLog.objects.filter(is_success=1).exclude(code=COURSE_REFRESH_LOG_CODE).latest('end_time')
         end_time = c.end_time
         return end_time
     except CronJobLog.DoesNotExist:
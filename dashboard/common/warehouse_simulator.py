@@ -0,0 +1,274 @@
+# Synthetic Unizin data warehouse and BigQuery access events, for benchmarking the cron job without production access.
+# The warehouse is generated in the PostgreSQL database of the DATA_WAREHOUSE connection, because the cron extracts
+# use PostgreSQL/Redshift SQL (AT TIME ZONE, getdate(), tuple IN parameters).
+
+import datetime
+import logging
+import math
+import uuid
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pyarrow as pa
+from django.conf import settings
+from google.cloud import bigquery_storage_v1beta1
+
+logger = logging.getLogger(__name__)
+
+# size of the simulated warehouse: total courses, enrollments and submissions, and the rows generated per course
+WarehouseScale = namedtuple("WarehouseScale", ["courses", "enrollments", "submissions", "assignments_per_course",
+                                               "groups_per_course", "files_per_course", "access_events_per_course"])
+DEFAULT_SCALE = WarehouseScale(courses=500, enrollments=200000, submissions=20000000, assignments_per_course=40,
+                               groups_per_course=4, files_per_course=100, access_events_per_course=20000)
+
+# the tables read by the cron extracts, with the columns they use
+WAREHOUSE_TABLES = {
+    "enrollment_term_dim": "id bigint primary key, canvas_id bigint, name varchar(255), "
+                           "date_start timestamp, date_end timestamp",
+    "course_dim": "id bigint primary key, canvas_id bigint, enrollment_term_id bigint, name varchar(255), "
+                  "start_at timestamp, conclude_at timestamp",
+    "user_dim": "id bigint primary key, global_canvas_id bigint, name varchar(255)",
+    "pseudonym_dim": "id bigint primary key, user_id bigint, unique_name varchar(255), sis_user_id varchar(255)",
+    "enrollment_dim": "id bigint primary key, user_id bigint, course_id bigint, type varchar(255), "
+                      "workflow_state varchar(255)",
+    "course_score_fact": "enrollment_id bigint, course_id bigint, current_score double precision, "
+                         "final_score double precision",
+    "assignment_group_dim": "id bigint primary key, course_id bigint, name varchar(255), workflow_state varchar(255)",
+    "assignment_group_fact": "assignment_group_id bigint, course_id bigint, group_weight double precision",
+    "assignment_group_rule_dim": "assignment_group_id bigint, drop_lowest integer, drop_highest integer",
+    "assignment_dim": "id bigint primary key, course_id bigint, title varchar(255), due_at timestamp, "
+                      "visibility varchar(255), workflow_state varchar(255), updated_at timestamp",
+    "assignment_fact": "assignment_id bigint, course_id bigint, points_possible double precision, "
+                       "assignment_group_id bigint",
+    "submission_dim": "id bigint primary key, graded_at timestamp, posted_at timestamp",
+    "submission_fact": "submission_id bigint, assignment_id bigint, course_id bigint, user_id bigint, "
+                       "published_score double precision",
+    "file_dim": "id bigint primary key, course_id bigint, display_name varchar(255), file_state varchar(255)",
+    "unizin_metadata": "key varchar(255), value varchar(255)",
+}
+
+WAREHOUSE_INDEXES = [
+    "create index on enrollment_dim (course_id)",
+    "create index on course_score_fact (enrollment_id)",
+    "create index on assignment_fact (course_id)",
+    "create index on assignment_group_fact (course_id)",
+    "create index on submission_fact (course_id)",
+    "create index on submission_fact (submission_id)",
+    "create index on file_dim (course_id)",
+]
+
+# every row is derived from generate_series, so even 20M submissions are generated inside PostgreSQL.
+# Course c (1..courses) has id increment + c; enrollment e belongs to course e % courses and user e % users
+WAREHOUSE_ROWS_SQL = [
+    """insert into enrollment_term_dim
+       select %(increment)s + 1, 1, 'Simulated Term', %(term_start)s, %(term_start)s + interval '120 days'""",
+    """insert into course_dim
+       select %(increment)s + c, c, %(increment)s + 1, 'Simulated Course ' || c,
+              %(term_start)s, %(term_start)s + interval '120 days'
+       from generate_series(1, %(courses)s) as c""",
+    """insert into user_dim
+       select %(increment)s + u, %(increment)s + u, 'Simulated User ' || u from generate_series(1, %(users)s) as u""",
+    """insert into pseudonym_dim
+       select %(increment)s + u, %(increment)s + u, 'user' || u, 'sis' || u from generate_series(1, %(users)s) as u""",
+    """insert into enrollment_dim
+       select %(increment)s + e, %(increment)s + 1 + e %% %(users)s, %(increment)s + 1 + e %% %(courses)s,
+              case when e %% 50 = 0 then 'TeacherEnrollment'
+                   when e %% 25 = 0 then 'TaEnrollment'
+                   else 'StudentEnrollment' end,
+              'active'
+       from generate_series(1, %(enrollments)s) as e""",
+    """insert into course_score_fact
+       select %(increment)s + e, %(increment)s + 1 + e %% %(courses)s, 50 + e %% 50, 50 + e %% 50
+       from generate_series(1, %(enrollments)s) as e""",
+    """insert into assignment_group_dim
+       select %(increment)s + g, %(increment)s + 1 + (g - 1) / %(groups_per_course)s, 'Group ' || g, 'available'
+       from generate_series(1, %(courses)s * %(groups_per_course)s) as g""",
+    """insert into assignment_group_fact
+       select %(increment)s + g, %(increment)s + 1 + (g - 1) / %(groups_per_course)s, 100.0 / %(groups_per_course)s
+       from generate_series(1, %(courses)s * %(groups_per_course)s) as g""",
+    """insert into assignment_group_rule_dim
+       select %(increment)s + g, 0, 0 from generate_series(1, %(courses)s * %(groups_per_course)s) as g""",
+    """insert into assignment_dim
+       select %(increment)s + a, %(increment)s + 1 + (a - 1) / %(assignments_per_course)s, 'Assignment ' || a,
+              %(term_start)s + (a %% 120) * interval '1 day', 'everyone', 'published', %(term_start)s
+       from generate_series(1, %(courses)s * %(assignments_per_course)s) as a""",
+    """insert into assignment_fact
+       select %(increment)s + a, %(increment)s + 1 + (a - 1) / %(assignments_per_course)s, 10,
+              %(increment)s + 1 + ((a - 1) / %(assignments_per_course)s) * %(groups_per_course)s
+                                + a %% %(groups_per_course)s
+       from generate_series(1, %(courses)s * %(assignments_per_course)s) as a""",
+    """insert into submission_dim
+       select %(increment)s + s,
+              %(term_start)s + (s %% 60) * interval '1 day',
+              %(term_start)s + (s %% 60) * interval '1 day'
+       from generate_series(1, %(submissions)s) as s""",
+    # submission s is made by the user of enrollment s % enrollments, for an assignment of the course of that enrollment
+    """insert into submission_fact
+       select %(increment)s + s,
+              %(increment)s + 1 + (s %% %(enrollments)s) %% %(courses)s * %(assignments_per_course)s
+                                + (s / %(enrollments)s) %% %(assignments_per_course)s,
+              %(increment)s + 1 + (s %% %(enrollments)s) %% %(courses)s,
+              %(increment)s + 1 + (s %% %(enrollments)s) %% %(users)s,
+              s %% 11
+       from generate_series(1, %(submissions)s) as s""",
+    """insert into file_dim
+       select %(increment)s + f, %(increment)s + 1 + (f - 1) / %(files_per_course)s, 'File ' || f,
+              case when f %% 20 = 0 then 'deleted' else 'available' end
+       from generate_series(1, %(courses)s * %(files_per_course)s) as f""",
+    """insert into unizin_metadata values ('schemaversion', 'simulated')""",
+]
+
+
+# the number of simulated users: about one for every four enrollments, and coprime with the number of courses so no
+# user is enrolled twice in the same course
+def get_user_count(scale):
+    users = max(scale.enrollments // 4, 1)
+    while math.gcd(users, scale.courses) != 1:
+        users += 1
+    return users
+
+
+# the default start of the simulated term: midnight UTC 60 days ago
+def get_default_term_start():
+    today = datetime.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - datetime.timedelta(days=60)
+
+
+# the course ids of the simulated warehouse
+def get_simulated_course_ids(scale):
+    return [settings.CANVAS_DATA_ID_INCREMENT + course for course in range(1, scale.courses + 1)]
+
+
+# drop and generate the simulated warehouse tables through a cursor of the DATA_WAREHOUSE connection
+def build_warehouse(cursor, scale=DEFAULT_SCALE, term_start=None):
+    if term_start is None:
+        term_start = get_default_term_start()
+    params = dict(scale._asdict(), increment=settings.CANVAS_DATA_ID_INCREMENT, term_start=term_start,
+                  users=get_user_count(scale))
+
+    for table_name, columns in WAREHOUSE_TABLES.items():
+        cursor.execute(f"drop table if exists {table_name}")
+        cursor.execute(f"create table {table_name} ({columns})")
+    # Redshift's getdate() returns the current UTC time without a time zone
+    cursor.execute("create or replace function getdate() returns timestamp as "
+                   "$$ select (now() at time zone 'utc')::timestamp $$ language sql stable")
+
+    for rows_sql in WAREHOUSE_ROWS_SQL:
+        logger.info(rows_sql.split("\n")[0])
+        cursor.execute(rows_sql, params)
+    for index_sql in WAREHOUSE_INDEXES:
+        cursor.execute(index_sql)
+    for table_name in WAREHOUSE_TABLES:
+        cursor.execute(f"analyze {table_name}")
+
+
+# a finished query job of FakeBigQueryClient, whose destination table holds synthetic Caliper access events.
+# Event e of a course happens e minutes after the term start, and only the events after start_time and up to end_time
+# are served and counted as processed
+class FakeQueryJob:
+
+    def __init__(self, course_ids, scale, term_start, batch_size, start_time=None, end_time=None, dry_run=False):
+        self.course_ids = course_ids
+        self.scale = scale
+        self.term_start = term_start
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.first_event = 0 if start_time is None else self.get_event_index(start_time) + 1
+        self.last_event = scale.access_events_per_course if end_time is None else self.get_event_index(end_time) + 1
+        self.events = range(max(self.first_event, 0), min(self.last_event, scale.access_events_per_course))
+        self.total_bytes_processed = len(course_ids) * len(self.events) * 100
+        # BigQuery bills at least 10 MB per query, and nothing for dry runs
+        self.total_bytes_billed = 0 if dry_run else max(self.total_bytes_processed, 10 * 1024 * 1024)
+        self.destination = SimpleNamespace(project='simulated', dataset_id='results', table_id=uuid.uuid4().hex)
+
+    # the index of the last event at or before a time
+    def get_event_index(self, event_time):
+        if event_time.tzinfo is not None:
+            event_time = event_time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return math.floor((event_time - self.term_start) / datetime.timedelta(minutes=1))
+
+    def result(self):
+        return self
+
+    # the events of a course as Arrow record batches of at most batch_size rows
+    def get_record_batches(self, course_id):
+        if self.dry_run:
+            return
+        users = get_user_count(self.scale)
+        course = course_id - settings.CANVAS_DATA_ID_INCREMENT
+        for batch_start in range(self.events.start, self.events.stop, self.batch_size):
+            events = range(batch_start, min(batch_start + self.batch_size, self.events.stop))
+            # canvas file resource ids are the ids of file_dim rows of the course
+            file_numbers = [(course - 1) * self.scale.files_per_course + 1 + event % self.scale.files_per_course
+                            for event in events]
+            # like the deduplicated query, resource_type and name are only set on the first access of each file
+            first_accesses = [event - self.events.start < self.scale.files_per_course for event in events]
+            yield pa.RecordBatch.from_arrays([
+                pa.array([str(settings.CANVAS_DATA_ID_INCREMENT + file_number) for file_number in file_numbers]),
+                pa.array([settings.CANVAS_DATA_ID_INCREMENT + 1 + (course + event * self.scale.courses) % users
+                          for event in events], pa.int64()),
+                pa.array([course_id] * len(events), pa.int64()),
+                pa.array([self.term_start + datetime.timedelta(minutes=event) for event in events], pa.timestamp('us')),
+                pa.array(first_accesses),
+                pa.array(["canvas" if first_access else None for first_access in first_accesses], pa.string()),
+                pa.array([f"File {file_number}" if first_access else None
+                          for file_number, first_access in zip(file_numbers, first_accesses)], pa.string()),
+            ], ["resource_id", "user_id", "course_id", "access_time", "first_access", "resource_type", "name"])
+
+
+# stands in for bigquery.Client in update_with_bq_access, answering every query with the access events of the
+# course_ids query parameter in the time window of the course_start_time and window_end_time parameters
+class FakeBigQueryClient:
+
+    def __init__(self, scale=DEFAULT_SCALE, term_start=None, batch_size=100000):
+        if term_start is None:
+            term_start = get_default_term_start()
+        self.scale = scale
+        self.term_start = term_start
+        self.batch_size = batch_size
+        # the finished jobs by the table id of their destination, read by FakeBigQueryStorageClient
+        self.jobs = {}
+
+    def query(self, query, location=None, job_config=None):
+        parameters = {parameter.name: parameter for parameter in job_config.query_parameters}
+        course_ids = [int(course_id) for course_id in parameters['course_ids'].values]
+        start_time = parameters['course_start_time'].value if 'course_start_time' in parameters else None
+        end_time = parameters['window_end_time'].value if 'window_end_time' in parameters else None
+        job = FakeQueryJob(course_ids, self.scale, self.term_start, self.batch_size, start_time, end_time,
+                           bool(job_config.dry_run))
+        self.jobs[job.destination.table_id] = job
+        return job
+
+
+# a stream of a read session of FakeBigQueryStorageClient, holding the events of one course of a job
+class FakeReadRowsStream:
+
+    def __init__(self, job, course_id):
+        self.job = job
+        self.course_id = course_id
+
+    def rows(self, read_session):
+        return self
+
+    @property
+    def pages(self):
+        for record_batch in self.job.get_record_batches(self.course_id):
+            yield SimpleNamespace(to_arrow=lambda record_batch=record_batch: record_batch)
+
+
+# stands in for bigquery_storage_v1beta1.BigQueryStorageClient, reading the destination tables of the jobs of a
+# FakeBigQueryClient with one stream per course
+class FakeBigQueryStorageClient:
+
+    def __init__(self, bigquery_client):
+        self.bigquery_client = bigquery_client
+
+    def create_read_session(self, table_reference, parent, **kwargs):
+        job = self.bigquery_client.jobs[table_reference.table_id]
+        streams = [bigquery_storage_v1beta1.types.Stream(name=f"{table_reference.table_id}/{course_id}")
+                   for course_id in job.course_ids]
+        return SimpleNamespace(streams=streams)
+
+    def read_rows(self, position):
+        table_id, course_id = position.stream.name.split("/")
+        return FakeReadRowsStream(self.bigquery_client.jobs[table_id], int(course_id))
@@ -1,78 +1,895 @@
 
-from django.db import connections as conns
+from django.db import connections as conns, transaction
 
 from dashboard.common import db_util, utils
 
 import logging
 import datetime
+import hashlib
 import pytz
-
-from sqlalchemy import create_engine
+import itertools
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+
+import MySQLdb
 from django.conf import settings
-from collections import namedtuple
+from django.utils import timezone
+from collections import Counter, namedtuple
 
-from dashboard.models import Course, Resource, AcademicTerms
+from dashboard.models import (Course, AcademicTerms, CronWatermark, CronCheckpoint, CronStageMetric, CronRowHash,
+                              CronLease)
 
+import numpy as np
 import pandas as pd
 
+import pyarrow as pa
+import pyarrow.parquet as pq
+
 # Imports the Google Cloud client library
-from google.cloud import bigquery
+from google.cloud import bigquery, bigquery_storage_v1beta1
 
 from django_cron import CronJobBase, Schedule
 
 logger = logging.getLogger(__name__)
 
-db_name = settings.DATABASES['default']['NAME']
-db_user = settings.DATABASES['default']['USER']
-db_password = settings.DATABASES['default']['PASSWORD']
-db_host = settings.DATABASES['default']['HOST']
-db_port = settings.DATABASES['default']['PORT']
+# MySQL error codes raised when LOAD DATA LOCAL INFILE is disabled on the server or the client
+LOAD_DATA_DISABLED_ERRORS = (1148, 2068, 3948)
 
-logger.debug("db-name:" + db_name)
-logger.debug("db-user:" + db_user)
-
-engine = create_engine("mysql+mysqldb://{user}:{password}@{host}:{port}/{db}?charset=utf8mb4"
-                       .format(db = db_name,  # your mysql database name
-                               user = db_user,  # your mysql user for the database
-                               password = db_password, # password for user
-                               host = db_host,
-                               port = db_port))
 
 # Split a list into *size* shorter pieces
 def split_list(a_list: list, size: int = 20):
     return [a_list[i:i + size] for i in range(0, len(a_list), size)]
 
-# the util function
-def util_function(data_warehouse_course_id, sql_string, mysql_table, table_identifier=None):
-    df = pd.read_sql(sql_string, conns['DATA_WAREHOUSE'])
-    logger.debug(df)
 
-    # Sql returns boolean value so grouping course info along with it so that this could be stored in the DB table.
-    if table_identifier == 'weight' and data_warehouse_course_id:
-        df['course_id']=data_warehouse_course_id
-        df.columns=['consider_weight','course_id']
+# serializes the MySQL writes of the extraction workers
+load_lock = threading.Lock()
+
+
+# run the stage function for one batch of course ids in a worker thread.
+# Each worker checks connections out of the pooled engines; the Django connections it opened for the cron models
+# are per thread, so they are closed afterwards.
+def run_in_worker(stage_function, data_warehouse_course_ids):
+    try:
+        return stage_function(data_warehouse_course_ids)
+    finally:
+        conns.close_all()
+
+
+# the run checkpoints are recorded for, and whether it resumes an earlier run that did not complete
+CronRun = namedtuple("CronRun", ["run_id", "resume"])
+cron_run = CronRun(uuid.uuid4().hex, False)
+
+
+# start a new run, or with resume pick up the latest run that did not complete
+def start_cron_run(resume=False):
+    global cron_run
+
+    run_id = CronCheckpoint.objects.get_unfinished_run_id() if resume else None
+    if run_id is None:
+        cron_run = CronRun(uuid.uuid4().hex, False)
+        return f"run {cron_run.run_id}\n"
+    cron_run = CronRun(run_id, True)
+    return f"resuming run {cron_run.run_id}\n"
+
+
+# start a refresh of single courses or a replay. They are not cron runs: without a run id they record no checkpoints
+# or metrics, so they neither resume nor disturb the runs of DashboardCronJob
+def start_unrecorded_run():
+    global cron_run
+    cron_run = CronRun(None, False)
+
+
+# the lease held by the cron run, course refresh or replay writing the MyLA tables, so that only one of them runs
+# across all cron pods
+CRON_LEASE_NAME = 'dashboard.cron'
+# set by the heartbeat when the lease expired and another process took it over
+cron_lease_lost = threading.Event()
+
+
+# raised when another process holds the cron lease, or when the lease was lost during a run
+class CronLeaseError(Exception):
+    pass
+
+
+# renew the cron lease every CRON_LEASE_HEARTBEAT_SECONDS until stopped. A failed renewal is retried on the next
+# heartbeat, the lease only expires after CRON_LEASE_SECONDS
+def renew_cron_lease(holder, stopped):
+    try:
+        while not stopped.wait(settings.CRON_LEASE_HEARTBEAT_SECONDS):
+            try:
+                renewed = CronLease.objects.renew(CRON_LEASE_NAME, holder, settings.CRON_LEASE_SECONDS)
+            except Exception:
+                logger.exception(f"Renewing the cron lease of {holder} failed")
+                continue
+            if not renewed:
+                logger.error(f"The cron lease of {holder} expired and was taken over by another process")
+                cron_lease_lost.set()
+                return
+    finally:
+        conns.close_all()
+
+
+# hold the cron lease while the block runs, renewing it from a heartbeat thread. Yields the holder id, or None when
+# another process holds a lease that has not expired
+@contextmanager
+def hold_cron_lease():
+    holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    if not CronLease.objects.acquire(CRON_LEASE_NAME, holder, settings.CRON_LEASE_SECONDS):
+        logger.info(f"cron lease not acquired: {CronLease.objects.filter(name=CRON_LEASE_NAME).first()}")
+        yield None
+        return
+    logger.info(f"cron lease acquired by {holder}")
+
+    cron_lease_lost.clear()
+    stopped = threading.Event()
+    heartbeat = threading.Thread(target=renew_cron_lease, args=(holder, stopped), name="cron-lease-heartbeat",
+                                 daemon=True)
+    heartbeat.start()
+    try:
+        yield holder
+    finally:
+        stopped.set()
+        heartbeat.join()
+        CronLease.objects.release(CRON_LEASE_NAME, holder)
+        logger.info(f"cron lease released by {holder}")
+
+
+# counters of the stage or course batch running in a thread
+metric_context = threading.local()
+# serializes adding the counters of a batch to its stage
+metric_lock = threading.Lock()
+METRIC_COUNTERS = ("query_seconds", "rows_extracted", "rows_loaded", "bytes_billed", "frame_bytes",
+                   "compact_frame_bytes")
+
 
-    # drop duplicates
-    df.drop_duplicates(keep='first', inplace=True)
+# the counters of the stage or course batch running in this thread, None outside of one
+def get_metric_counters():
+    return getattr(metric_context, 'counters', None)
 
-    logger.debug(" table: " + mysql_table + " insert size: " + str(df.shape[0]))
 
-    # write to MySQL
+# add to the counters of the stage or course batch running in this thread
+def count_metrics(**counts):
+    counters = get_metric_counters()
+    if counters is not None:
+        for name, value in counts.items():
+            counters[name] += value
+
+
+# the resident memory of the process in MB, None where /proc/self/statm cannot be read
+def get_rss_mb():
     try:
-        df.to_sql(con=engine, name=mysql_table, if_exists='append', index=False)
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError):
+        return None
+
+
+# how often the resident memory is sampled while a stage or course batch runs, in seconds
+RSS_SAMPLE_SECONDS = 0.1
+
+
+# sample the resident memory every RSS_SAMPLE_SECONDS until stopped, keeping the highest sample in peak['mb']
+def sample_peak_rss(peak, stopped):
+    while True:
+        rss_mb = get_rss_mb()
+        if rss_mb is not None and (peak['mb'] is None or rss_mb > peak['mb']):
+            peak['mb'] = rss_mb
+        if stopped.wait(RSS_SAMPLE_SECONDS):
+            return
+
+
+# record a CronStageMetric row for the stage or course batch run inside the block, also when it fails, adding its
+# counters to the counters of the stage it is part of (by default the one running in this thread)
+@contextmanager
+def record_metrics(stage, data_warehouse_course_ids=None, parent_counters=None):
+    if parent_counters is None:
+        parent_counters = get_metric_counters()
+    counters = dict.fromkeys(METRIC_COUNTERS, 0)
+    previous_counters = get_metric_counters()
+    metric_context.counters = counters
+    started_at = timezone.now()
+    start_time = time.perf_counter()
+    # the highest resident memory sampled while the block runs. ru_maxrss is the peak of the whole process so far,
+    # which misses a stage that stays under the peak of an earlier one
+    peak = {'mb': None}
+    sampler_stopped = threading.Event()
+    sampler = threading.Thread(target=sample_peak_rss, args=(peak, sampler_stopped), daemon=True)
+    sampler.start()
+    status = 'failed'
+    try:
+        yield counters
+        status = 'succeeded'
+    finally:
+        sampler_stopped.set()
+        sampler.join()
+        metric_context.counters = previous_counters
+        if cron_run.run_id is not None:
+            try:
+                CronStageMetric.objects.create(run_id=cron_run.run_id, stage=stage,
+                                               course_ids=course_ids_string(data_warehouse_course_ids),
+                                               started_at=started_at, wall_seconds=time.perf_counter() - start_time,
+                                               peak_memory_mb=peak['mb'], status=status, **counters)
+            except Exception:
+                logger.exception(f"Error recording the metrics of {stage}")
+            if parent_counters is not None:
+                with metric_lock:
+                    for name, value in counters.items():
+                        parent_counters[name] += value
+
+
+# the checkpoint key of a batch of course ids
+def get_batch_key(data_warehouse_course_ids):
+    return hashlib.sha1(",".join(map(str, sorted(data_warehouse_course_ids))).encode()).hexdigest()
+
+
+# run the stage function for a batch of course ids unless the batch was completed in the resumed run, and record
+# its checkpoint and metrics. Rows a resumed run loaded for the batch before failing are deleted before it is loaded
+# again
+def run_checkpointed_batch(stage_function, table_name, data_warehouse_course_ids, parent_counters=None):
+    if cron_run.run_id is None:
+        return stage_function(data_warehouse_course_ids)
+    batch_key = get_batch_key(data_warehouse_course_ids)
+    if CronCheckpoint.objects.is_completed(cron_run.run_id, table_name, batch_key):
+        return (f"{table_name} : {course_ids_string(data_warehouse_course_ids)} already loaded "
+                f"in run {cron_run.run_id}\n")
+    if cron_run.resume and table_name in reloading_tables:
+        with load_lock:
+            executeDbQuery(f"delete from `{get_load_table(table_name)}` where course_id in %(course_ids)s",
+                           {'course_ids': tuple(data_warehouse_course_ids)})
+
+    with record_metrics(table_name, data_warehouse_course_ids, parent_counters):
+        status = stage_function(data_warehouse_course_ids)
+    CronCheckpoint.objects.mark_completed(cron_run.run_id, table_name, batch_key)
+    return status
+
+
+# run the stage function over the batches of course ids, with up to CRON_MAX_WORKERS batches at once,
+# and return their statuses concatenated in batch order. With a table name, each batch records a checkpoint and metrics
+def run_course_batches(stage_function, course_id_batches, table_name=None):
+    if table_name is not None:
+        batch_function = stage_function
+        # the workers add their counters to the stage running in this thread
+        stage_counters = get_metric_counters()
+
+        def stage_function(data_warehouse_course_ids):
+            return run_checkpointed_batch(batch_function, table_name, data_warehouse_course_ids, stage_counters)
+    if settings.CRON_MAX_WORKERS <= 1:
+        return "".join(stage_function(data_warehouse_course_ids) for data_warehouse_course_ids in course_id_batches)
+
+    with ThreadPoolExecutor(max_workers=settings.CRON_MAX_WORKERS) as executor:
+        return "".join(executor.map(run_in_worker, itertools.repeat(stage_function), course_id_batches))
+
+
+# escape the text of a column for the default FIELDS and LINES options of LOAD DATA
+def escape_load_data_text(values):
+    return (values.str.replace('\\', '\\\\', regex=False).str.replace('\t', '\\t', regex=False)
+            .str.replace('\n', '\\n', regex=False).str.replace('\r', '\\r', regex=False)
+            .str.replace('\0', '\\0', regex=False))
+
+
+# write a DataFrame as a tab separated file in the format LOAD DATA reads by default, with \N for missing values
+def write_load_data_file(df, file):
+    text_columns = []
+    for column in df.columns:
+        values = df[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            if values.dt.tz is not None:
+                values = values.dt.tz_convert(pytz.UTC).dt.tz_localize(None)
+            text = values.astype(str)
+        elif pd.api.types.is_bool_dtype(values):
+            text = values.astype(int).astype(str)
+        elif pd.api.types.is_float_dtype(values):
+            text = values.map(lambda value: str(int(value)) if value.is_integer() else repr(float(value)),
+                              na_action='ignore')
+        else:
+            text = escape_load_data_text(values.map(lambda value: str(int(value))
+                                                    if isinstance(value, (bool, np.bool_)) else value).astype(str))
+        text_columns.append(text.where(values.notna(), '\\N'))
+
+    for row in zip(*text_columns):
+        file.write('\t'.join(row) + '\n')
+
+
+# write a DataFrame into a table with LOAD DATA LOCAL INFILE through a temporary file
+def load_data_infile(df, mysql_table):
+    columns = ", ".join(f"`{column}`" for column in df.columns)
+    with tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', suffix='.tsv', delete=False) as load_file:
+        write_load_data_file(df, load_file)
+    try:
+        # only the connections of the loader engine enable LOAD DATA LOCAL INFILE on the client side
+        connection = db_util.get_engine(loader=True).raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"load data local infile %s into table `{mysql_table}` character set utf8mb4 ({columns})",
+                           (load_file.name,))
+            connection.commit()
+        finally:
+            connection.close()
+    finally:
+        os.remove(load_file.name)
+
+
+# whether LOAD DATA LOCAL INFILE is still used, it is turned off for the rest of the run when the server refuses it
+use_load_data = settings.CRON_LOAD_BACKEND == 'load_data'
+
+
+# write a DataFrame to a MySQL table with the CRON_LOAD_BACKEND loader and return the time it took in seconds
+def load_dataframe(df, mysql_table):
+    global use_load_data
+
+    start_time = time.perf_counter()
+    if use_load_data and not df.empty:
+        try:
+            load_data_infile(df, mysql_table)
+            return time.perf_counter() - start_time
+        except MySQLdb.OperationalError as e:
+            if e.args[0] not in LOAD_DATA_DISABLED_ERRORS:
+                raise
+            logger.warning(f"LOAD DATA LOCAL INFILE is not allowed, falling back to to_sql: {e}")
+            use_load_data = False
+            start_time = time.perf_counter()
+
+    df.to_sql(con=db_util.get_engine(), name=mysql_table, if_exists='append', index=False)
+    return time.perf_counter() - start_time
+
+
+# a cron stage: it waits for the earlier stages that write one of its inputs (tables or other data it reads).
+# A failing optional stage is logged and only skips the stages that depend on it
+CronStage = namedtuple("CronStage", ["name", "function", "inputs", "outputs", "optional"])
+
+
+# run a stage unless it was completed in the resumed run, record its checkpoint and return its status and duration
+# in seconds
+def run_stage(stage):
+    if CronCheckpoint.objects.is_completed(cron_run.run_id, stage.name):
+        return f"{stage.name} : already completed in run {cron_run.run_id}\n", 0
+
+    start_time = time.perf_counter()
+    logger.info(f"** {stage.name}")
+    with record_metrics(stage.name):
+        status = stage.function()
+    CronCheckpoint.objects.mark_completed(cron_run.run_id, stage.name)
+    return status, time.perf_counter() - start_time
+
+
+# run a stage in a worker thread, closing the Django connections of the thread afterwards
+def run_stage_in_worker(stage):
+    try:
+        return run_stage(stage)
+    finally:
+        conns.close_all()
+
+
+# the longest chain of dependent stages by duration, as a list of stage names, and its total duration
+def find_critical_path(dependencies, durations):
+    chain_durations = {}
+    chain_previous = {}
+    for stage_name, duration in durations.items():
+        previous = max((dependency for dependency in dependencies[stage_name] if dependency in chain_durations),
+                       key=chain_durations.get, default=None)
+        chain_durations[stage_name] = duration + (chain_durations[previous] if previous is not None else 0)
+        chain_previous[stage_name] = previous
+
+    if not chain_durations:
+        return [], 0
+    stage_name = max(chain_durations, key=chain_durations.get)
+    critical_path_duration = chain_durations[stage_name]
+    critical_path = []
+    while stage_name is not None:
+        critical_path.insert(0, stage_name)
+        stage_name = chain_previous[stage_name]
+    return critical_path, critical_path_duration
+
+
+# run the stages as a dependency graph, with up to CRON_STAGE_WORKERS independent stages at once, and return
+# their statuses in the order the stages are listed followed by their timings and the critical path
+def run_stage_graph(stages):
+    output_stages = {}
+    dependencies = {}
+    for stage in stages:
+        dependencies[stage.name] = {output_stages[table] for table in stage.inputs if table in output_stages}
+        for table in stage.outputs:
+            output_stages[table] = stage.name
+
+    statuses = {}
+    durations = {}
+    failed = set()
+    first_error = None
+    pending = list(stages)
+    running = {}
+    start_time = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=settings.CRON_STAGE_WORKERS) if settings.CRON_STAGE_WORKERS > 1 else None
+    try:
+        while pending or running:
+            # after losing the lease no more stages are started, another process is running the cron job now
+            if cron_lease_lost.is_set() and first_error is None:
+                first_error = CronLeaseError("the cron lease was lost to another process")
+            for stage in list(pending):
+                if dependencies[stage.name] & failed:
+                    pending.remove(stage)
+                    failed.add(stage.name)
+                    statuses[stage.name] = f"skipped {stage.name}: a stage it depends on failed\n"
+                    continue
+                ready = first_error is None and dependencies[stage.name] <= durations.keys()
+                if ready and len(running) < max(settings.CRON_STAGE_WORKERS, 1):
+                    pending.remove(stage)
+                    if executor is None:
+                        # one stage at a time runs in the cron thread, in the order the stages are listed
+                        future = Future()
+                        try:
+                            future.set_result(run_stage(stage))
+                        except Exception as e:
+                            future.set_exception(e)
+                    else:
+                        future = executor.submit(run_stage_in_worker, stage)
+                    running[future] = stage
+            if not running:
+                break
+
+            done_futures, not_done_futures = wait(running, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                stage = running.pop(future)
+                try:
+                    statuses[stage.name], durations[stage.name] = future.result()
+                except Exception as e:
+                    failed.add(stage.name)
+                    statuses[stage.name] = f"failed {stage.name}: {e}\n"
+                    if not stage.optional:
+                        first_error = first_error or e
+                    logger.exception(f"Exception running stage {stage.name}")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+    if first_error is not None:
+        raise first_error
+
+    status = "".join(statuses.get(stage.name, "") for stage in stages)
+    for stage in stages:
+        if stage.name in durations:
+            status += f"stage {stage.name}: {durations[stage.name]:.1f}s\n"
+    critical_path, critical_path_duration = find_critical_path(dependencies, durations)
+    status += (f"critical path: {' > '.join(critical_path)} ({critical_path_duration:.1f}s of "
+               f"{time.perf_counter() - start_time:.1f}s)\n")
+    return status
+
+
+# columns returned by the deduplicated query of the RESOURCE_ACCESS_CONFIG queries. resource_type and name are only
+# set on the first access of each resource, flagged by first_access, so they are not transferred again for every access
+RESOURCE_ACCESS_COLUMNS = ["resource_id", "user_id", "course_id", "access_time", "first_access", "resource_type",
+                           "name"]
+
+
+# read the rows of a finished BigQuery query job as Arrow record batches, one page at a time. With a BigQuery Storage
+# client the streams of a read session of the job's destination table are read, otherwise the pages of the REST API
+def read_bq_arrow_batches(bq_query, bqstorage_client=None):
+    rows = bq_query.result()
+    if bqstorage_client is None:
+        field_names = [field.name for field in rows.schema]
+        for page in rows.pages:
+            page_rows = list(page)
+            yield pa.RecordBatch.from_arrays([pa.array([row[index] for row in page_rows])
+                                              for index in range(len(field_names))], field_names)
+        return
+
+    destination = bq_query.destination
+    table_reference = bigquery_storage_v1beta1.types.TableReference(
+        project_id=destination.project, dataset_id=destination.dataset_id, table_id=destination.table_id)
+    read_session = bqstorage_client.create_read_session(table_reference, f"projects/{destination.project}",
+                                                        format_=bigquery_storage_v1beta1.enums.DataFormat.ARROW)
+    for stream in read_session.streams:
+        position = bigquery_storage_v1beta1.types.StreamPosition(stream=stream)
+        for page in bqstorage_client.read_rows(position).rows(read_session).pages:
+            yield page.to_arrow()
+
+
+# give resource access rows compact column types: categorical resource_type, integer user_id and timestamp access_time
+def compact_resource_access_dtypes(df):
+    return (df.astype({'resource_type': 'category', 'user_id': 'Int64'})
+            .assign(access_time=pd.to_datetime(df['access_time'])))
+
+
+# read the resource access rows of BigQuery query jobs as one DataFrame per Arrow record batch, so each batch can be
+# loaded before the next one is downloaded
+def read_resource_access_dataframes(bq_queries, bqstorage_client=None):
+    for bq_query in bq_queries:
+        for record_batch in read_bq_arrow_batches(bq_query, bqstorage_client):
+            # integer_object_nulls keeps ids with missing values exact instead of turning them into floats
+            yield compact_dataframe(compact_resource_access_dtypes(record_batch.to_pandas(integer_object_nulls=True)),
+                                    'resource_access')
+
+
+# column types of the extracts of each table with CRON_COMPACT_DTYPES: "category" for columns with few distinct
+# values, "integer" to downcast integer columns and "datetime" to parse timestamps once when they are read
+TABLE_DTYPES = {
+    'academic_terms': {'date_start': 'datetime', 'date_end': 'datetime'},
+    'user': {'course_id': 'category', 'enrollment_type': 'category'},
+    'assignment_groups': {'course_id': 'category', 'drop_lowest': 'integer', 'drop_highest': 'integer'},
+    'assignment': {'course_id': 'category', 'assignment_group_id': 'category', 'due_date': 'datetime',
+                   'local_date': 'datetime'},
+    'submission': {'assignment_id': 'category', 'course_id': 'category', 'graded_date': 'datetime'},
+    'resource_access': {'resource_id': 'category', 'name': 'category'},
+}
+
+
+# give an extract the compact column types of its table with CRON_COMPACT_DTYPES, and count its memory before and after
+def compact_dataframe(df, table_name):
+    frame_bytes = int(df.memory_usage(deep=True).sum())
+    if not settings.CRON_COMPACT_DTYPES:
+        count_metrics(frame_bytes=frame_bytes, compact_frame_bytes=frame_bytes)
+        return df
+
+    compact_columns = {}
+    for column, dtype in TABLE_DTYPES.get(table_name, {}).items():
+        if column not in df.columns:
+            continue
+        values = df[column]
+        if dtype == 'category':
+            compact_columns[column] = values.astype('category')
+        elif dtype == 'integer' and pd.api.types.is_integer_dtype(values):
+            compact_columns[column] = pd.to_numeric(values, downcast='integer')
+        elif dtype == 'datetime' and not pd.api.types.is_datetime64_any_dtype(values):
+            compact_columns[column] = pd.to_datetime(values)
+    df = df.assign(**compact_columns)
+    count_metrics(frame_bytes=frame_bytes, compact_frame_bytes=int(df.memory_usage(deep=True).sum()))
+    return df
+
+
+# format the load rate of a table for the cron status
+def load_rate_string(row_count, load_seconds):
+    rows_per_second = row_count / load_seconds if load_seconds > 0 else 0
+    return f"{rows_per_second:.0f} rows/s"
+
+
+# format the course ids of a batch for the cron status
+def course_ids_string(data_warehouse_course_ids):
+    return ",".join(map(str, data_warehouse_course_ids)) if data_warehouse_course_ids else ""
+
+
+# directory the extracts of the current run are staged in, None when CRON_STAGING_DIR is not set
+staging_run_dir = None
+# orders the staged files of a run
+staging_sequence = itertools.count()
+
+
+# start staging the extracts of a run in CRON_STAGING_DIR/<date>, replacing what an earlier run of the day staged
+# unless the run is resumed
+def start_staging_run():
+    global staging_run_dir, staging_sequence
+
+    staging_run_dir = None
+    if not settings.CRON_STAGING_DIR:
+        return ""
+    staging_run_dir = os.path.join(settings.CRON_STAGING_DIR, datetime.date.today().isoformat())
+    staging_sequence = itertools.count()
+    if cron_run.resume and os.path.isdir(staging_run_dir):
+        # a resumed run adds its extracts after the ones staged before it failed
+        staged_files = [file_name for stage in os.listdir(staging_run_dir)
+                        for file_name in os.listdir(os.path.join(staging_run_dir, stage))]
+        staging_sequence = itertools.count(max((int(file_name.split("-", 1)[0]) + 1 for file_name in staged_files),
+                                               default=0))
+        return f"staging extracts in {staging_run_dir}\n"
+    shutil.rmtree(staging_run_dir, ignore_errors=True)
+    return f"staging extracts in {staging_run_dir}\n"
+
+
+# persist an extract of a stage as a Parquet file and return its path, None without staging. The mode tells the replay
+# how the rows were applied: load (into a reloaded table), append, upsert or delete (a frame of the deleted ids)
+def stage_extract(df, stage, mode='load'):
+    if staging_run_dir is None:
+        return None
+    stage_dir = os.path.join(staging_run_dir, stage)
+    os.makedirs(stage_dir, exist_ok=True)
+    # Parquet keeps nullable integers exact as objects
+    df = df.astype({column: object for column, dtype in df.dtypes.items() if isinstance(dtype, pd.Int64Dtype)})
+    path = os.path.join(stage_dir, f"{next(staging_sequence):06d}-{mode}.parquet")
+    df.to_parquet(path, index=False)
+    return path
+
+
+# list the staged files of a stage in the order they were written, as (mode, path) tuples
+def list_staged_extracts(run_dir, stage):
+    stage_dir = os.path.join(run_dir, stage)
+    if not os.path.isdir(stage_dir):
+        return []
+    return [(file_name[:-len(".parquet")].split("-", 1)[1], os.path.join(stage_dir, file_name))
+            for file_name in sorted(os.listdir(stage_dir)) if file_name.endswith(".parquet")]
+
+
+# read a staged extract, keeping integer columns with missing values exact
+def read_staged_extract(path):
+    return pq.read_table(path).to_pandas(integer_object_nulls=True)
+
+
+# read a warehouse query through a server-side (named) cursor, yielding a DataFrame per CRON_STREAM_CHUNK_SIZE rows
+def read_warehouse_chunks(sql_string, params=None):
+    # the pooled connection runs in a transaction, which keeps the named cursor open between fetches
+    warehouse_connection = db_util.get_engine('DATA_WAREHOUSE').raw_connection()
+    try:
+        cursor = warehouse_connection.cursor(name=f"cron_{uuid.uuid4().hex}")
+        try:
+            cursor.execute(sql_string, params)
+            while True:
+                rows = cursor.fetchmany(settings.CRON_STREAM_CHUNK_SIZE)
+                if not rows:
+                    break
+                yield pd.DataFrame.from_records(rows, columns=[column[0] for column in cursor.description])
+        finally:
+            cursor.close()
+    finally:
+        warehouse_connection.close()
+
+
+# read a warehouse query as DataFrames, with CRON_STREAM_CHUNK_SIZE a chunk at a time, counting the time spent
+# waiting on the warehouse as query time
+def read_warehouse(sql_string, params=None):
+    if settings.CRON_STREAM_CHUNK_SIZE:
+        chunks = read_warehouse_chunks(sql_string, params)
+    else:
+        # without a chunk size the whole result is read as one DataFrame
+        start_time = time.perf_counter()
+        chunks = iter([pd.read_sql(sql_string, db_util.get_engine('DATA_WAREHOUSE'), params=params)])
+        count_metrics(query_seconds=time.perf_counter() - start_time)
+
+    while True:
+        start_time = time.perf_counter()
+        df = next(chunks, None)
+        count_metrics(query_seconds=time.perf_counter() - start_time)
+        if df is None:
+            return
+        count_metrics(rows_extracted=df.shape[0])
+        yield df
+
+
+# the util function. The extract queries select distinct rows, so the warehouse drops the duplicates before they are
+# transferred and the rows are loaded as they are read
+def util_function(data_warehouse_course_ids, sql_string, mysql_table, params=None):
+    # with CRON_STREAM_CHUNK_SIZE the rows are written a chunk at a time, so memory stays bounded by the chunk size
+    row_count = 0
+    load_seconds = 0
+    for df in read_warehouse(sql_string, params):
+        df = compact_dataframe(df, mysql_table)
+        logger.debug(df)
+
+        logger.debug(" table: " + mysql_table + " insert size: " + str(df.shape[0]))
+        stage_extract(df, mysql_table)
+
+        # write to MySQL
+        try:
+            with load_lock:
+                loaded_row_count, table_load_seconds = load_table_rows(df, mysql_table)
+                load_seconds += table_load_seconds
+        except Exception as e:
+            logger.exception(f"Error loading table {mysql_table}")
+            raise
+        row_count += df.shape[0]
+        count_metrics(rows_loaded=loaded_row_count)
+
+    # returns the row size of dataframe
+    return (f"{str(row_count)} {mysql_table} : {course_ids_string(data_warehouse_course_ids)} "
+            f"({load_rate_string(row_count, load_seconds)})\n")
+
+
+# write the rows of a table being reloaded, or with a row hash diff only the rows that changed.
+# Returns the number of rows written and the time it took in seconds
+def load_table_rows(df, mysql_table):
+    if mysql_table not in row_hash_diffs:
+        return df.shape[0], load_dataframe(df, get_load_table(mysql_table))
+
+    df = get_changed_rows(df, mysql_table)
+    start_time = time.perf_counter()
+    if not df.empty:
+        upsert_dataframe(df, mysql_table)
+    return df.shape[0], time.perf_counter() - start_time
+
+
+# load only the rows changed in the warehouse since the stored high-water marks of a batch of courses.
+# build_sql takes a SQL condition selecting the changed rows and returns the full extract query for the batch;
+# rows removed from the warehouse are deleted and rows missing locally are fetched along with the changed ones.
+# Courses without a high-water mark are loaded in full, selected by course_expression
+def incremental_util_function(data_warehouse_course_ids, build_sql, changed_condition, id_expression, course_expression,
+                              mysql_table, watermark_column, extra_columns=()):
+    course_params = {'course_ids': tuple(data_warehouse_course_ids)}
+    watermarks = {data_warehouse_course_id: CronWatermark.objects.get_watermark(mysql_table, data_warehouse_course_id)
+                  for data_warehouse_course_id in data_warehouse_course_ids}
+    reload_course_ids = [data_warehouse_course_id for data_warehouse_course_id, watermark in watermarks.items()
+                         if watermark is None]
+
+    # compare the ids currently in the warehouse with the ids already loaded
+    ids_sql = f"select id from ({build_sql('1=1')}) as warehouse_ids"
+    query_start_time = time.perf_counter()
+    warehouse_ids = set(pd.read_sql(ids_sql, db_util.get_engine('DATA_WAREHOUSE'), params=course_params)['id'])
+    count_metrics(query_seconds=time.perf_counter() - query_start_time)
+    mysql_ids = set(pd.read_sql(f"select id from {mysql_table} where course_id in %(course_ids)s", db_util.get_engine(),
+                                params=course_params)['id'])
+    stale_ids = mysql_ids - warehouse_ids
+    missing_ids = warehouse_ids - mysql_ids
+
+    params = dict(course_params)
+    # without a high-water mark for any course, or when most of the batch is missing locally, reload the whole batch
+    if len(reload_course_ids) == len(data_warehouse_course_ids) or len(missing_ids) > len(warehouse_ids) / 2:
+        logger.info(f"Loading all {mysql_table} rows for courses {course_ids_string(data_warehouse_course_ids)}")
+        changed_filter = "1=1"
+    else:
+        # changes are selected from the oldest mark in the batch; upserting a row again is harmless
+        changed_filter = f"({changed_condition})"
+        oldest_watermark = min(watermark for watermark in watermarks.values() if watermark is not None)
+        params['watermark'] = oldest_watermark.astimezone(pytz.UTC).replace(tzinfo=None)
+        if reload_course_ids:
+            logger.info(f"Loading all {mysql_table} rows for courses {course_ids_string(reload_course_ids)}")
+            changed_filter += f" or {course_expression} in %(reload_course_ids)s"
+            params['reload_course_ids'] = tuple(reload_course_ids)
+        if missing_ids:
+            changed_filter += f" or {id_expression} in %(missing_ids)s"
+            params['missing_ids'] = tuple(missing_ids)
+
+    # courses loaded without any row to take a high-water mark from are marked with the time of the extract, so they
+    # are not loaded in full again
+    extract_time = timezone.now()
+    query_start_time = time.perf_counter()
+    df = pd.read_sql(build_sql(changed_filter), db_util.get_engine('DATA_WAREHOUSE'), params=params)
+    count_metrics(query_seconds=time.perf_counter() - query_start_time, rows_extracted=df.shape[0])
+    df = compact_dataframe(df, mysql_table)
+    logger.debug(f" table: {mysql_table} changed size: {df.shape[0]} stale size: {len(stale_ids)}")
+
+    with load_lock:
+        new_watermarks = df.groupby('course_id')[watermark_column].max() if not df.empty else pd.Series(dtype=object)
+        if not df.empty:
+            df.drop(columns=list(extra_columns), inplace=True)
+            stage_extract(df, mysql_table, 'upsert')
+            upsert_dataframe(df, mysql_table)
+            count_metrics(rows_loaded=df.shape[0])
+        for data_warehouse_course_id, watermark in watermarks.items():
+            new_watermark = new_watermarks.get(data_warehouse_course_id)
+            if pd.notna(new_watermark):
+                new_watermark = pd.Timestamp(new_watermark).to_pydatetime().replace(tzinfo=pytz.UTC)
+            elif watermark is None:
+                new_watermark = extract_time
+            else:
+                continue
+            # rows fetched because they were missing locally can be older than the mark
+            if watermark is None or new_watermark > watermark:
+                CronWatermark.objects.set_watermark(mysql_table, data_warehouse_course_id, new_watermark)
+        if stale_ids:
+            stage_extract(pd.DataFrame({'id': sorted(stale_ids)}), mysql_table, 'delete')
+        delete_rows_by_id(mysql_table, stale_ids)
+
+    return (f"{str(df.shape[0])} {mysql_table} upserted, {len(stale_ids)} deleted : "
+            f"{course_ids_string(data_warehouse_course_ids)}\n")
+
+
+# convert a DataFrame to a list of tuples the MySQL driver can bind, with missing values as None
+def dataframe_to_records(df):
+    records = df.astype(object).where(pd.notnull(df), None)
+    return [tuple(value.to_pydatetime() if isinstance(value, pd.Timestamp) else value for value in row)
+            for row in records.itertuples(index=False, name=None)]
+
+
+# the statement inserting the rows of a DataFrame
+def get_insert_sql(df, mysql_table):
+    columns = ", ".join(f"`{column}`" for column in df.columns)
+    placeholders = ", ".join(["%s"] * len(df.columns))
+    return f"insert into `{mysql_table}` ({columns}) values ({placeholders})"
+
+
+# the statement inserting the rows of a DataFrame, updating the rows whose primary key already exists. The columns of
+# existing rows are replaced, unless update_expressions maps them to the SQL expressions they are set to instead
+def get_upsert_sql(df, mysql_table, update_expressions=None):
+    update_expressions = dict({column: f"values(`{column}`)" for column in df.columns}, **(update_expressions or {}))
+    updates = ", ".join(f"`{column}` = {expression}" for column, expression in update_expressions.items())
+    return f"{get_insert_sql(df, mysql_table)} on duplicate key update {updates}"
+
+
+# write the rows of a DataFrame with an insert or upsert statement through the Django connection of this thread,
+# so they are written in its current transaction
+def execute_dataframe(sql, df):
+    if df.empty:
+        return
+    with conns['default'].cursor() as cursor:
+        cursor.executemany(sql, dataframe_to_records(df))
+
+
+# insert the rows of a DataFrame, updating the rows whose primary key already exists, see get_upsert_sql
+def upsert_dataframe(df, mysql_table, update_expressions=None):
+    upsert_sql = get_upsert_sql(df, mysql_table, update_expressions)
+
+    connection = db_util.get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.executemany(upsert_sql, dataframe_to_records(df))
+        connection.commit()
     except Exception as e:
-        logger.exception(f"Error running to_sql on table {mysql_table}")
+        logger.exception(f"Error upserting into table {mysql_table}")
         raise
+    finally:
+        connection.close()
+
+
+# delete the rows with the given ids, a chunk at a time
+def delete_rows_by_id(mysql_table, ids, id_column='id', chunk_size=1000):
+    for id_chunk in split_list(sorted(ids), chunk_size):
+        executeDbQuery(f"delete from {mysql_table} where {id_column} in ({', '.join(str(int(id)) for id in id_chunk)})")
 
-    # returns the row size of dataframe
-    return f"{str(df.shape[0])} {mysql_table} : {data_warehouse_course_id}\n"
+
+# load the file_dim rows into a temporary table and apply them to resource with two join statements: rename the
+# resources of available files and delete the others. Returns the number of updated and removed rows
+def apply_file_states(df_attach):
+    df_attach = df_attach.assign(id=df_attach['id'].astype(str))
+
+    # temporary tables only live in the session that created them, so everything runs on one connection
+    connection = db_util.get_engine().raw_connection()
+    try:
+        cursor = connection.cursor()
+        # a pooled connection may still hold the table from a run that failed
+        cursor.execute("drop temporary table if exists resource_file_state")
+        cursor.execute("""create temporary table resource_file_state (
+                              id varchar(255) not null primary key,
+                              file_state varchar(255) null,
+                              display_name longtext null)""")
+        cursor.executemany("insert into resource_file_state (id, file_state, display_name) values (%s, %s, %s)",
+                           dataframe_to_records(df_attach[['id', 'file_state', 'display_name']]))
+        updated_count = cursor.execute("""update resource r join resource_file_state f on r.resource_id = f.id
+                                          set r.name = f.display_name
+                                          where f.file_state = 'available'""")
+        removed_count = cursor.execute("""delete r from resource r join resource_file_state f on r.resource_id = f.id
+                                          where f.file_state is null or f.file_state <> 'available'""")
+        cursor.execute("drop temporary table resource_file_state")
+        connection.commit()
+    except Exception as e:
+        logger.exception("Error applying file states to table resource")
+        raise
+    finally:
+        connection.close()
+    return updated_count, removed_count
 
 
 # execute database query
-def executeDbQuery(query):
-    with engine.connect() as connection:
-        connection.detach()
-        connection.execute(query)
+def executeDbQuery(query, params=None):
+    # a pooled connection in a transaction that commits when the block ends
+    with db_util.get_engine().begin() as connection:
+        if params is None:
+            connection.execute(query)
+        else:
+            connection.execute(query, params)
+
+
+# number of equal-width bins of the assignment score histograms
+ASSIGNMENT_SCORE_HISTOGRAM_BINS = 10
+
+
+# the score statistics of the assignments of a batch of courses, computed from the scored rows of the submission table
+def get_assignment_score_stats(data_warehouse_course_ids):
+    query_start_time = time.perf_counter()
+    df = pd.read_sql("""select assignment_id, course_id, score from submission
+                        where course_id in %(course_ids)s and score is not null""",
+                     db_util.get_engine(), params={'course_ids': tuple(data_warehouse_course_ids)})
+    count_metrics(query_seconds=time.perf_counter() - query_start_time, rows_extracted=df.shape[0])
+
+    stats = []
+    for (assignment_id, course_id), scores in df.groupby(['assignment_id', 'course_id'])['score']:
+        first_quartile, median, third_quartile = np.percentile(scores, [25, 50, 75])
+        counts, bin_edges = np.histogram(scores, bins=ASSIGNMENT_SCORE_HISTOGRAM_BINS)
+        stats.append((assignment_id, course_id, len(scores), scores.mean(), median, first_quartile, third_quartile,
+                      json.dumps({'bin_edges': bin_edges.round(2).tolist(), 'counts': counts.tolist()})))
+    return pd.DataFrame(stats, columns=['assignment_id', 'course_id', 'count', 'mean', 'median', 'first_quartile',
+                                        'third_quartile', 'histogram'])
+
+
+# compute and load the assignment score statistics of a batch of courses
+def load_assignment_score_stats(data_warehouse_course_ids):
+    df = get_assignment_score_stats(data_warehouse_course_ids)
+    with load_lock:
+        loaded_row_count, load_seconds = load_table_rows(df, 'assignment_score_stats')
+    count_metrics(rows_loaded=loaded_row_count)
+    return (f"{str(df.shape[0])} assignment_score_stats : {course_ids_string(data_warehouse_course_ids)} "
+            f"({load_rate_string(df.shape[0], load_seconds)})\n")
 
 
 # remove all records inside the specified table
@@ -83,14 +900,376 @@ def deleteAllRecordInTable(tableName):
     return f"delete : {tableName}\n"
 
 
+# key column of the tables that can be reloaded by row hash diff with CRON_ROW_HASH_TABLES
+ROW_HASH_KEYS = {
+    'academic_terms': 'id',
+    'assignment': 'id',
+    'assignment_groups': 'id',
+    'assignment_weight_consideration': 'course_id',
+    'submission': 'id',
+    'unizin_metadata': 'pkey',
+}
+# a table reloaded by row hash diff: the hashes stored by the previous run and the hashes of the rows extracted by
+# this one, by row key, and the churn counts
+RowHashDiff = namedtuple("RowHashDiff", ["previous_hashes", "current_hashes", "counts"])
+# tables reloaded by row hash diff in this run, by table name
+row_hash_diffs = {}
+
+
+# start reloading a table by row hash diff: rows are only written when their hash differs from the stored one,
+# and the rows that were not extracted again are deleted in finish_table_reload
+def start_row_hash_diff(table_name):
+    status = ""
+    previous_hashes = CronRowHash.objects.get_row_hashes(table_name)
+    if not previous_hashes:
+        # without stored hashes the table is emptied once, so the hashes describe every row it holds
+        status += deleteAllRecordInTable(table_name)
+    # every batch is diffed again when a run is resumed, so the deletes see all the rows still in the warehouse
+    CronCheckpoint.objects.clear_batches(cron_run.run_id, table_name)
+    row_hash_diffs[table_name] = RowHashDiff(previous_hashes, {}, Counter())
+    return status + f"row hash diff : {table_name}\n"
+
+
+# the text a value is hashed as: \N for missing values, numbers without a trailing .0 when they are integral and
+# timestamps in naive UTC, so a value hashes the same whatever type its column was read as
+def get_canonical_string(value):
+    if value is None or (np.isscalar(value) and pd.isna(value)):
+        return '\\N'
+    if isinstance(value, (bool, np.bool_)):
+        return str(int(value))
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating)):
+        return str(int(value)) if float(value).is_integer() else repr(float(value))
+    if isinstance(value, (datetime.date, np.datetime64)):
+        value = pd.Timestamp(value)
+        if value.tz is not None:
+            value = value.tz_convert(pytz.UTC).tz_localize(None)
+        return value.strftime('%Y-%m-%dT%H:%M:%S.%f')
+    return str(value)
+
+
+# the columns of an extract as the text get_canonical_string gives their values. Typed columns are formatted a column
+# at a time, so integer columns read as floats because of missing values, or compacted to categories and smaller
+# integers, give the same text
+def get_canonical_frame(df):
+    columns = {}
+    for column, values in df.items():
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object)
+        if pd.api.types.is_datetime64_any_dtype(values):
+            if values.dt.tz is not None:
+                values = values.dt.tz_convert(pytz.UTC).dt.tz_localize(None)
+            text = values.dt.strftime('%Y-%m-%dT%H:%M:%S.%f')
+        elif pd.api.types.is_bool_dtype(values) and not pd.api.types.is_object_dtype(values):
+            text = values.astype(int).astype(str)
+        elif pd.api.types.is_integer_dtype(values) and not pd.api.types.is_extension_array_dtype(values):
+            text = values.astype(str)
+        else:
+            text = values.map(get_canonical_string)
+        columns[column] = text.where(values.notna(), '\\N')
+    return pd.DataFrame(columns, index=df.index)
+
+
+# hash the rows of an extract and return the ones that are new or changed since the previous run
+def get_changed_rows(df, table_name):
+    row_hash_diff = row_hash_diffs[table_name]
+    canonical_df = get_canonical_frame(df)
+    row_keys = canonical_df[ROW_HASH_KEYS[table_name]]
+    row_hashes = [f"{row_hash:016x}" for row_hash in pd.util.hash_pandas_object(canonical_df, index=False).values]
+
+    is_changed = []
+    for row_key, row_hash in zip(row_keys, row_hashes):
+        previous_hash = row_hash_diff.previous_hashes.get(row_key)
+        if previous_hash is None:
+            row_hash_diff.counts['inserted'] += 1
+        elif previous_hash != row_hash:
+            row_hash_diff.counts['updated'] += 1
+        else:
+            row_hash_diff.counts['unchanged'] += 1
+        is_changed.append(previous_hash != row_hash)
+        row_hash_diff.current_hashes[row_key] = row_hash
+    return df[np.array(is_changed, dtype=bool)]
+
+
+# delete the rows of a table whose key column is in row_keys, a chunk at a time
+def delete_rows_by_key(table_name, key_column, row_keys, chunk_size=1000):
+    for key_chunk in split_list(sorted(row_keys), chunk_size):
+        executeDbQuery(f"delete from `{table_name}` where `{key_column}` in %(row_keys)s",
+                       {'row_keys': tuple(key_chunk)})
+
+
+# finish a row hash diff: delete the rows that were not extracted again, store the new hashes and report the churn
+def finish_row_hash_diff(table_name):
+    row_hash_diff = row_hash_diffs.pop(table_name)
+    key_column = ROW_HASH_KEYS[table_name]
+    # the rows to delete are read from the table itself, because rows written by a run that failed before storing
+    # their hashes have none
+    table_df = pd.read_sql(f"select `{key_column}` from `{table_name}`", db_util.get_engine())
+    table_keys = get_canonical_frame(table_df)[key_column]
+    deleted_keys = set(table_keys) - row_hash_diff.current_hashes.keys()
+    delete_rows_by_key(table_name, key_column, deleted_keys)
+
+    changed_hashes = [(table_name, row_key, row_hash) for row_key, row_hash in row_hash_diff.current_hashes.items()
+                      if row_hash_diff.previous_hashes.get(row_key) != row_hash]
+    if changed_hashes:
+        upsert_dataframe(pd.DataFrame(changed_hashes, columns=['table_name', 'row_key', 'row_hash']), 'cron_row_hash')
+    stale_hash_keys = row_hash_diff.previous_hashes.keys() - row_hash_diff.current_hashes.keys()
+    for key_chunk in split_list(sorted(stale_hash_keys), 1000):
+        CronRowHash.objects.filter(table_name=table_name, row_key__in=key_chunk).delete()
+
+    counts = row_hash_diff.counts
+    return (f"{table_name} : {counts['inserted']} inserted, {counts['updated']} updated, {len(deleted_keys)} deleted, "
+            f"{counts['unchanged']} unchanged\n")
+
+
+# tables being reloaded into a shadow copy, by the name of the table they replace
+shadow_tables = {}
+# tables being reloaded in this run
+reloading_tables = set()
+
+
+# whether a table exists in the MySQL database
+def table_exists(table_name):
+    engine = db_util.get_engine()
+    with engine.connect() as connection:
+        return engine.dialect.has_table(connection, table_name)
+
+
+# prepare a table for a full reload: with CRON_USE_SHADOW_TABLES the rows are loaded into an empty copy of the table
+# that replaces it in finish_table_reload, otherwise the records of the table are deleted.
+# A resumed run keeps the batches it already loaded into the table. Tables in CRON_ROW_HASH_TABLES are diffed instead
+def start_table_reload(table_name):
+    if table_name in settings.CRON_ROW_HASH_TABLES and table_name in ROW_HASH_KEYS:
+        return start_row_hash_diff(table_name)
+
+    reloading_tables.add(table_name)
+    shadow_table = f"{table_name}_shadow"
+    if cron_run.resume and CronCheckpoint.objects.has_batches(cron_run.run_id, table_name):
+        if not settings.CRON_USE_SHADOW_TABLES:
+            return f"resume : {table_name}\n"
+        if table_exists(shadow_table):
+            shadow_tables[table_name] = shadow_table
+            return f"resume : {shadow_table}\n"
+        # the batches were loaded into a shadow table that is gone, so they are loaded again
+        CronCheckpoint.objects.clear_batches(cron_run.run_id, table_name)
+
+    if not settings.CRON_USE_SHADOW_TABLES:
+        return deleteAllRecordInTable(table_name)
+
+    # a shadow table left behind by a failed run is discarded
+    executeDbQuery(f"drop table if exists `{shadow_table}`")
+    executeDbQuery(f"create table `{shadow_table}` like `{table_name}`")
+    shadow_tables[table_name] = shadow_table
+    return f"shadow : {table_name}\n"
+
+
+# the table that rows of the given table are loaded into
+def get_load_table(table_name):
+    return shadow_tables.get(table_name, table_name)
+
+
+# publish a table reloaded into a shadow copy by swapping it with the current table in one atomic rename,
+# so readers see the previous snapshot until the new one is complete
+def finish_table_reload(table_name):
+    if table_name in row_hash_diffs:
+        return finish_row_hash_diff(table_name)
+
+    reloading_tables.discard(table_name)
+    shadow_table = shadow_tables.pop(table_name, None)
+    if shadow_table is None:
+        return ""
+
+    old_table = f"{table_name}_old"
+    executeDbQuery(f"drop table if exists `{old_table}`")
+    executeDbQuery(f"rename table `{table_name}` to `{old_table}`, `{shadow_table}` to `{table_name}`")
+    executeDbQuery(f"drop table `{old_table}`")
+    return f"publish : {table_name}\n"
+
+
+# prepare reloading a table: the whole table, or with course ids only the rows of those courses, which are deleted
+def start_course_reload(table_name, data_warehouse_course_ids=None):
+    if data_warehouse_course_ids is None:
+        return start_table_reload(table_name)
+    executeDbQuery(f"delete from `{table_name}` where course_id in %(course_ids)s",
+                   {'course_ids': tuple(data_warehouse_course_ids)})
+    return f"delete : {table_name} for courses {course_ids_string(data_warehouse_course_ids)}\n"
+
+
+# finish reloading a table started with start_course_reload
+def finish_course_reload(table_name, data_warehouse_course_ids=None):
+    if data_warehouse_course_ids is None:
+        return finish_table_reload(table_name)
+    return ""
+
+
+# delete the resource rows of a batch of courses and the resource_access and resource_access_daily rows of those
+# resources
+def delete_course_resources(data_warehouse_course_ids):
+    course_params = {'course_ids': tuple(data_warehouse_course_ids)}
+    executeDbQuery(f"delete from `{get_load_table('resource_access_daily')}` where course_id in %(course_ids)s",
+                   course_params)
+    executeDbQuery(f"""delete ra from `{get_load_table('resource_access')}` ra
+                       join `{get_load_table('resource')}` r on ra.resource_id = r.resource_id
+                       where r.course_id in %(course_ids)s""", course_params)
+    executeDbQuery(f"delete from `{get_load_table('resource')}` where course_id in %(course_ids)s", course_params)
+
+
+# the number of accesses of each course in resource_access_daily, the event volume of its last load
+def get_course_event_counts(data_warehouse_course_ids):
+    if not settings.CRON_BQ_BATCH_EVENT_LIMIT or len(data_warehouse_course_ids) == 0:
+        return {}
+    df = pd.read_sql("""select course_id, cast(sum(access_count) as signed) as event_count from resource_access_daily
+                        where course_id in %(course_ids)s group by course_id""",
+                     db_util.get_engine(), params={'course_ids': tuple(data_warehouse_course_ids)})
+    return dict(zip(df['course_id'], df['event_count']))
+
+
+# incremental runs add the accesses of a day to the ones already loaded for it
+RESOURCE_ACCESS_DAILY_UPDATES = {
+    'access_count': "`access_count` + values(`access_count`)",
+    'last_access_time': "greatest(`last_access_time`, values(`last_access_time`))",
+}
+
+
+# roll resource accesses up into resource_access_daily rows, counting the accesses of each course, resource and user
+# on each UTC day along with the last access time
+def get_resource_access_daily(resource_access_df):
+    access_times = resource_access_df['access_time']
+    if access_times.dt.tz is not None:
+        access_times = access_times.dt.tz_convert(pytz.UTC).dt.tz_localize(None)
+    return (resource_access_df.assign(access_time=access_times, day=access_times.dt.date)
+            .groupby(['course_id', 'resource_id', 'user_id', 'day'], observed=True)['access_time']
+            .agg(access_count='size', last_access_time='max').reset_index())
+
+
+# add the daily rollup of resource access rows to the rollup of the rows read before them, None for no rows yet
+def add_resource_access_daily(resource_access_daily_df, resource_access_df):
+    batch_daily_df = get_resource_access_daily(resource_access_df)
+    if resource_access_daily_df is None:
+        return batch_daily_df
+    return (pd.concat([resource_access_daily_df, batch_daily_df], ignore_index=True)
+            .groupby(['course_id', 'resource_id', 'user_id', 'day'], observed=True)
+            .agg(access_count=('access_count', 'sum'), last_access_time=('last_access_time', 'max')).reset_index())
+
+
+# split the courses into BigQuery batches of at most CRON_BQ_IN_LIMIT courses and, by the event counts of their last
+# load, about CRON_BQ_BATCH_EVENT_LIMIT events. The largest courses are placed first, each into the first batch with
+# room for it, so a course over the limit gets a batch of its own. Courses without a count weigh as much as the
+# average course, and without any counts the courses are split into batches of CRON_BQ_IN_LIMIT
+def get_bq_course_batches(data_warehouse_course_ids, course_event_counts):
+    if not settings.CRON_BQ_BATCH_EVENT_LIMIT or not course_event_counts:
+        return split_list(list(data_warehouse_course_ids), settings.CRON_BQ_IN_LIMIT)
+
+    average_event_count = np.mean(list(course_event_counts.values()))
+    event_counts = {course_id: course_event_counts.get(course_id, average_event_count)
+                    for course_id in data_warehouse_course_ids}
+    batches = []
+    batch_event_counts = []
+    for course_id in sorted(event_counts, key=event_counts.get, reverse=True):
+        for index, batch in enumerate(batches):
+            batch_event_count = batch_event_counts[index] + event_counts[course_id]
+            if len(batch) < settings.CRON_BQ_IN_LIMIT and batch_event_count <= settings.CRON_BQ_BATCH_EVENT_LIMIT:
+                batch.append(course_id)
+                batch_event_counts[index] += event_counts[course_id]
+                break
+        else:
+            batches.append([course_id])
+            batch_event_counts.append(event_counts[course_id])
+    return batches
+
+
+# the distinct resource accesses of the RESOURCE_ACCESS_CONFIG queries, for the events after @course_start_time and
+# up to @window_end_time when those parameters are given. BigQuery drops the (resource_id, user_id, access_time)
+# duplicates, and the resource_type and name of each resource are returned once on its first access in the window.
+# Both come from one query, because a second query for the resources would scan the events table again
+def build_resource_access_query(has_start_time, has_end_time):
+    final_bq_query = []
+    for k, query_obj in settings.RESOURCE_ACCESS_CONFIG.items():
+        # concatenate the multi-line presentation of query into one single string
+        query = " ".join(query_obj['query'])
+
+        if has_start_time:
+            # insert the start time parameter for query
+            query += " and event_time > @course_start_time"
+        if has_end_time:
+            query += " and event_time <= @window_end_time"
+
+        final_bq_query.append(query)
+    return f"""with events as ({"  UNION ALL   ".join(final_bq_query)}),
+               accesses as (select resource_id, user_id, course_id, access_time,
+                                   any_value(resource_type) as resource_type, any_value(name) as name
+                            from events group by resource_id, user_id, course_id, access_time),
+               ranked_accesses as (select *,
+                                          row_number() over (partition by resource_id, course_id
+                                                             order by access_time) = 1 as first_access
+                                   from accesses)
+               select resource_id, user_id, course_id, access_time, first_access,
+                      if(first_access, resource_type, null) as resource_type, if(first_access, name, null) as name
+               from ranked_accesses"""
+
+
+# the bytes a BigQuery query would scan, estimated by a dry run. Dry runs are not billed
+def estimate_bq_query_bytes(bigquery_client, query, query_params):
+    job_config = bigquery.QueryJobConfig()
+    job_config.dry_run = True
+    job_config.use_query_cache = False
+    job_config.query_parameters = query_params
+    return bigquery_client.query(query, location='US', job_config=job_config).total_bytes_processed or 0
+
+
+# shortest time window a BigQuery batch is split into to stay within CRON_BQ_MAX_BYTES_BILLED
+BQ_MIN_TIME_WINDOW = datetime.timedelta(days=1)
+# a half window has to be estimated under this share of its window for the split to narrow the scan
+BQ_SPLIT_MIN_REDUCTION = 0.9
+
+
+# raised when a batch is estimated over CRON_BQ_MAX_BYTES_BILLED and narrower time windows cannot bring it under
+class BigQueryCostError(Exception):
+    pass
+
+
+# the (start, end, estimated bytes) time windows a batch is queried in. With CRON_BQ_MAX_BYTES_BILLED a window
+# estimated over the cap is split in half until every window fits. This only narrows the scan when the events table is
+# partitioned or clustered by event_time, so BigQueryCostError is raised instead of querying windows that would all
+# fail on the cap: when neither half is estimated meaningfully under its window, or at BQ_MIN_TIME_WINDOW.
+# A window without an end reaches to now
+def get_bq_time_windows(estimate_bytes, start_time, end_time=None, estimated_bytes=None):
+    if estimated_bytes is None:
+        estimated_bytes = estimate_bytes(start_time, end_time)
+    if not settings.CRON_BQ_MAX_BYTES_BILLED or estimated_bytes <= settings.CRON_BQ_MAX_BYTES_BILLED:
+        return [(start_time, end_time, estimated_bytes)]
+
+    window_string = (f"BigQuery window from {start_time} to {end_time or 'now'} is estimated at "
+                     f"{bq_cost_string(estimated_bytes)}, over CRON_BQ_MAX_BYTES_BILLED "
+                     f"({bq_cost_string(settings.CRON_BQ_MAX_BYTES_BILLED)})")
+    window_end_time = end_time or timezone.now()
+    if start_time is None or window_end_time - start_time <= BQ_MIN_TIME_WINDOW:
+        raise BigQueryCostError(f"{window_string}, and cannot be split further")
+    middle_time = start_time + (window_end_time - start_time) / 2
+    first_bytes = estimate_bytes(start_time, middle_time)
+    second_bytes = estimate_bytes(middle_time, end_time)
+    if min(first_bytes, second_bytes) > estimated_bytes * BQ_SPLIT_MIN_REDUCTION:
+        raise BigQueryCostError(f"{window_string}, and its halves are estimated at {bq_cost_string(first_bytes)} and "
+                                f"{bq_cost_string(second_bytes)}: the events table is not partitioned or clustered "
+                                f"by event_time, so narrower windows would scan as much")
+    first_windows = get_bq_time_windows(estimate_bytes, start_time, middle_time, first_bytes)
+    return first_windows + get_bq_time_windows(estimate_bytes, middle_time, end_time, second_bytes)
+
+
+# format BigQuery bytes with their price at CRON_BQ_PRICE_PER_TB
+def bq_cost_string(bytes_billed):
+    return (f"{bytes_billed / 1024 / 1024 / 1024:.2f} GB = "
+            f"${bytes_billed / 1024 / 1024 / 1024 / 1024 * settings.CRON_BQ_PRICE_PER_TB:.2f}")
+
+
 # use Django ORM to compare warehouse and existing data and, if necessary, update DateTime field of model instance
-def update_datetime_field(course_obj, course_field_name, warehouse_dataframe, warehouse_field_name):
+def update_datetime_field(course_obj, course_field_name, warehouse_field_value):
     course_field_value = getattr(course_obj, course_field_name)
     # Skipping update if the field already has a value, provided by a previous cron run or administrator
     if course_field_value is not None:
         logger.info(f"Update of {course_field_name} skipped; existing value was found.")
     else:
-        warehouse_field_value = warehouse_dataframe[warehouse_field_name].iloc[0]
         if pd.notna(warehouse_field_value):
             warehouse_field_value = warehouse_field_value.replace(tzinfo=pytz.UTC)
             setattr(course_obj, course_field_name, warehouse_field_value)
@@ -99,51 +1278,113 @@ def update_datetime_field(course_obj, course_field_name, warehouse_dataframe, wa
     return []
 
 
+# assignment extract for the course ids passed as the course_ids query parameter;
+# changed_filter limits the query to the assignments selected by incremental runs
+def get_assignment_sql(changed_filter=None):
+    if changed_filter is None:
+        updated_at_column = ""
+        changed_clause = ""
+    else:
+        updated_at_column = ", ad.updated_at AS updated_at"
+        changed_clause = f"and ({changed_filter})"
+    return f"""with assignment_info as
+                            (select ad.due_at AS due_date,
+                            ad.due_at at time zone 'utc' at time zone '{settings.TIME_ZONE}' as local_date,
+                            ad.title AS name,af.course_id AS course_id,af.assignment_id AS id,
+                            af.points_possible AS points_possible,
+                            af.assignment_group_id AS assignment_group_id{updated_at_column}
+                            from assignment_fact af inner join assignment_dim ad on af.assignment_id = ad.id
+                            where af.course_id in %(course_ids)s
+                            and ad.visibility = 'everyone' and ad.workflow_state='published' {changed_clause})
+                            select distinct * from assignment_info
+                            """
+
+
+# submission extract for the course ids passed as the course_ids query parameter;
+# changed_filter limits the query to the submissions selected by incremental runs
+def get_submission_sql(changed_filter=None):
+    changed_clause = f"and ({changed_filter})" if changed_filter is not None else ""
+    return f"""with sub_fact as (select submission_id, assignment_id, course_id, user_id, global_canvas_id,
+                                 published_score
+                                 from submission_fact sf join user_dim u on sf.user_id = u.id
+                                 where course_id in %(course_ids)s),
+                enrollment as (select distinct user_id, course_id from enrollment_dim
+                               where course_id in %(course_ids)s and workflow_state='active'
+                               and type = 'StudentEnrollment'),
+                sub_with_enroll as (select sf.* from sub_fact sf
+                                    join enrollment e on e.user_id = sf.user_id and e.course_id = sf.course_id),
+                submission_time as (select sd.id, sd.graded_at,
+                                    sd.posted_at at time zone 'utc' at time zone '{settings.TIME_ZONE}'
+                                    as grade_posted_local_date
+                                    from submission_dim sd join sub_fact suf on sd.id=suf.submission_id
+                                    where posted_at is not null and posted_at < getdate() {changed_clause}),
+                assign_fact as (select s.*,a.title from assignment_dim a join sub_with_enroll s on s.assignment_id=a.id
+                                where a.course_id in %(course_ids)s and a.workflow_state='published'),
+                assign_sub_time as (select a.*, t.graded_at, t.grade_posted_local_date
+                                    from assign_fact a join submission_time t on a.submission_id = t.id),
+                all_assign_sub as (select submission_id AS id, assignment_id AS assignment_id, course_id,
+                                   global_canvas_id AS user_id, round(published_score,1) AS score,
+                                   graded_at AS graded_date, grade_posted_local_date
+                                   from assign_sub_time order by assignment_id)
+                select distinct * from all_assign_sub
+          """
+
+
+# the supported course ids, or the given ones, in batches of CRON_DW_IN_LIMIT, for one warehouse query per batch
+def get_course_id_batches(data_warehouse_course_ids=None):
+    if data_warehouse_course_ids is None:
+        data_warehouse_course_ids = Course.objects.get_supported_courses()
+    return split_list(list(data_warehouse_course_ids), settings.CRON_DW_IN_LIMIT)
+
+
 # cron job to populate course and user tables
 class DashboardCronJob(CronJobBase):
 
     schedule = Schedule(run_at_times=settings.RUN_AT_TIMES)
     code = 'dashboard.DashboardCronJob'    # a unique code
 
+    # resume the latest run that did not complete, set by the cron management command
+    resume = False
+
 
     # verify whether course ids are valid
     def verify_course_ids(self):
         # whether all course ids are valid ids
         invalid_course_id_list = []
-        course_dfs = []
+        courses_data = pd.DataFrame()
 
         logger.debug("in checking course")
 
-        # loop through multiple course ids
-        for course_id in Course.objects.get_supported_courses():
-            # select course based on course id
-            course_sql = f"""
+        # select all the supported courses in one query
+        course_ids = list(Course.objects.get_supported_courses())
+        if len(course_ids) > 0:
+            course_sql = """
                 select id, canvas_id, enrollment_term_id, name, start_at, conclude_at
                 from course_dim c
-                where c.id = '{course_id}'
+                where c.id in %(course_ids)s
             """
             logger.debug(course_sql)
-            course_df = pd.read_sql(course_sql, conns['DATA_WAREHOUSE'])
-
-            # error out when course id is invalid, otherwise add DataFrame to list
-            if course_df.empty:
-                logger.error(f"""Course {course_id} don't have the entry in data warehouse yet. """)
-                invalid_course_id_list.append(course_id)
-            else:
-                course_dfs.append(course_df)
-
-        if len(course_dfs) > 0:
-            courses_data = pd.concat(course_dfs).reset_index()
+            courses_data = pd.read_sql(course_sql, db_util.get_engine('DATA_WAREHOUSE'),
+                                       params={'course_ids': tuple(course_ids)})
+
+            # error out when course id is invalid
+            warehouse_course_ids = set(courses_data['id'])
+            for course_id in course_ids:
+                if course_id not in warehouse_course_ids:
+                    logger.error(f"""Course {course_id} don't have the entry in data warehouse yet. """)
+                    invalid_course_id_list.append(course_id)
+
+        if not courses_data.empty:
+            stage_extract(courses_data, 'course_dim')
         else:
             logger.info("No course records were found in the database.")
-            courses_data = pd.DataFrame()
 
         CourseVerification = namedtuple("CourseVerification", ["invalid_course_ids", "course_data"])
         return CourseVerification(invalid_course_id_list, courses_data)
 
 
-    # update USER records from DATA_WAREHOUSE
-    def update_user(self):
+    # update USER records from DATA_WAREHOUSE, for all supported courses or only the given ones
+    def update_user(self, data_warehouse_course_ids=None):
 
         # cron status
         status = ""
@@ -151,32 +1392,38 @@ def update_user(self):
         logger.debug("in update with data warehouse user")
 
         # delete all records in the table first
-        status += deleteAllRecordInTable("user")
-
-        # loop through multiple course ids
-        for data_warehouse_course_id in Course.objects.get_supported_courses():
-
-
-            # select all student registered for the course
-            user_sql=f"""with
-                         enroll_data as (select id as enroll_id, user_id, type from enrollment_dim where course_id='{data_warehouse_course_id}'
-                                         and type in ('StudentEnrollment', 'TaEnrollment', 'TeacherEnrollment') and workflow_state= 'active'),
-                         user_info as (select p.unique_name,p.sis_user_id, u.name, u.id as user_id, u.global_canvas_id
-                                        from pseudonym_dim p join user_dim u on u.id = p.user_id where p.sis_user_id is not null),
-                         user_enroll as (select u.unique_name, u.sis_user_id, u.name, u.user_id, e.enroll_id,
-                                         u.global_canvas_id, e.type from enroll_data e join user_info u on e.user_id= u.user_id),
-                         course_fact as (select enrollment_id, current_score, final_score from course_score_fact
-                                         where course_id='{data_warehouse_course_id}'),
-                         final as (select u.global_canvas_id as user_id,u.name, u.sis_user_id as sis_id, u.unique_name as sis_name,
-                                   '{data_warehouse_course_id}' as course_id, c.current_score as current_grade, c.final_score as final_grade,
-                                    u.type as enrollment_type
-                                    from user_enroll u left join course_fact c on u.enroll_id= c.enrollment_id)
-                         select * from final
-                      """
-            logger.debug(user_sql)
-
-            status += util_function(data_warehouse_course_id, user_sql, 'user')
-
+        status += start_course_reload("user", data_warehouse_course_ids)
+
+        # select all student registered for a batch of courses
+        user_sql = """with
+                     enroll_data as (select id as enroll_id, user_id, course_id, type from enrollment_dim
+                                     where course_id in %(course_ids)s
+                                     and type in ('StudentEnrollment', 'TaEnrollment', 'TeacherEnrollment')
+                                     and workflow_state= 'active'),
+                     user_info as (select p.unique_name,p.sis_user_id, u.name, u.id as user_id, u.global_canvas_id
+                                    from pseudonym_dim p join user_dim u on u.id = p.user_id
+                                    where p.sis_user_id is not null),
+                     user_enroll as (select u.unique_name, u.sis_user_id, u.name, u.user_id, e.enroll_id, e.course_id,
+                                     u.global_canvas_id, e.type
+                                     from enroll_data e join user_info u on e.user_id= u.user_id),
+                     course_fact as (select enrollment_id, current_score, final_score from course_score_fact
+                                     where course_id in %(course_ids)s),
+                     final as (select u.global_canvas_id as user_id,u.name, u.sis_user_id as sis_id,
+                               u.unique_name as sis_name, u.course_id as course_id,
+                               c.current_score as current_grade, c.final_score as final_grade,
+                                u.type as enrollment_type
+                                from user_enroll u left join course_fact c on u.enroll_id= c.enrollment_id)
+                     select distinct * from final
+                  """
+        logger.debug(user_sql)
+
+        # loop through batches of course ids
+        status += run_course_batches(
+            lambda data_warehouse_course_ids: util_function(data_warehouse_course_ids, user_sql, 'user',
+                                                            params={'course_ids': tuple(data_warehouse_course_ids)}),
+            get_course_id_batches(data_warehouse_course_ids), 'user')
+
+        status += finish_course_reload("user", data_warehouse_course_ids)
         return status
 
 
@@ -189,229 +1436,505 @@ def update_unizin_metadata(self):
         logger.debug("in update unizin metadata")
 
         # delete all records in the table first
-        status += deleteAllRecordInTable("unizin_metadata")
+        status += start_table_reload("unizin_metadata")
 
         # select all student registered for the course
-        metadata_sql = "select key as pkey, value as pvalue from unizin_metadata"
+        metadata_sql = "select distinct key as pkey, value as pvalue from unizin_metadata"
 
         logger.debug(metadata_sql)
 
-        status += util_function("", metadata_sql, 'unizin_metadata')
+        status += util_function(None, metadata_sql, 'unizin_metadata')
 
+        status += finish_table_reload("unizin_metadata")
         return status
 
 
     # update file records from Canvas that don't have names provided
-    def update_canvas_resource(self):
+    def update_canvas_resource(self, data_warehouse_course_ids=None):
         # cron status
         status = ""
 
         logger.debug("in update canvas resource")
 
         # Select all the files for these courses
-        course_ids = Course.objects.get_supported_courses()
+        course_ids = data_warehouse_course_ids
+        if course_ids is None:
+            course_ids = Course.objects.get_supported_courses()
         file_sql = f"select id, file_state, display_name from file_dim where course_id in %(course_ids)s"
-        df_attach = pd.read_sql(file_sql, conns['DATA_WAREHOUSE'], params={'course_ids':tuple(course_ids)})
+        query_start_time = time.perf_counter()
+        df_attach = pd.read_sql(file_sql, db_util.get_engine('DATA_WAREHOUSE'),
+                                params={'course_ids': tuple(course_ids)})
+        count_metrics(query_seconds=time.perf_counter() - query_start_time, rows_extracted=df_attach.shape[0])
+        stage_extract(df_attach, 'file_dim')
 
         # Update these back again based on the dataframe
         # Remove any rows where file_state is not available!
-        for row in df_attach.itertuples(index=False):
-            if row.file_state == 'available':
-                Resource.objects.filter(resource_id=row.id).update(name=row.display_name)
-                status += f"Row {row.id} updated to {row.display_name}\n"
-            else:
-                Resource.objects.filter(resource_id=row.id).delete()
-                status += f"Row {row.id} removed as it is not available\n"
+        updated_count, removed_count = apply_file_states(df_attach)
+        count_metrics(rows_loaded=updated_count + removed_count)
+        status += f"{len(df_attach)} files in file_dim : {updated_count} resource names updated, " \
+                  f"{removed_count} unavailable resources removed\n"
         return status
 
 
     # update RESOURCE_ACCESS records from BigQuery
-    def update_with_bq_access(self):
+    # the BigQuery clients can be passed in, for instance a fake client that yields Arrow record batches
+    # With course ids only the events of those courses are reloaded
+    def update_with_bq_access(self, bigquery_client=None, bqstorage_client=None, data_warehouse_course_ids=None):
 
         # cron status
         status = ""
 
-        # delete all records in resource and resource_access table
-        status += deleteAllRecordInTable("resource")
-        status += deleteAllRecordInTable("resource_access")
-
-        # return string with concatenated SQL insert result
-        return_string = ""
+        # incremental runs append the events newer than the last access_time loaded for each course,
+        # with a full reload when the last one is older than CRON_BQ_FULL_RELOAD_DAYS
+        full_reload = True
+        if settings.CRON_INCREMENTAL and data_warehouse_course_ids is None:
+            last_full_load = CronWatermark.objects.get_last_full_load('resource_access')
+            full_reload_due = timezone.now() - datetime.timedelta(days=settings.CRON_BQ_FULL_RELOAD_DAYS)
+            full_reload = last_full_load is None or last_full_load <= full_reload_due
+        run_start_time = timezone.now()
+
+        loaded_course_ids = data_warehouse_course_ids
+        if loaded_course_ids is None:
+            loaded_course_ids = list(Course.objects.get_supported_courses())
+        # full reloads size the batches by the events loaded for each course last time, before they are deleted
+        course_event_counts = get_course_event_counts(loaded_course_ids) if full_reload else {}
+
+        if data_warehouse_course_ids is not None:
+            delete_course_resources(data_warehouse_course_ids)
+            status += (f"delete : resource, resource_access, resource_access_daily for courses "
+                       f"{course_ids_string(data_warehouse_course_ids)}\n")
+        elif full_reload:
+            # delete all records in resource and resource_access table
+            status += start_table_reload("resource")
+            status += start_table_reload("resource_access")
+            status += start_table_reload("resource_access_daily")
+        else:
+            status += "appending new resource_access rows and adding them to resource_access_daily\n"
 
         # Instantiates a client
-        bigquery_client = bigquery.Client()
-
-        # BQ Total Bytes Billed to report to status
-        total_bytes_billed = 0
+        if bigquery_client is None:
+            bigquery_client = bigquery.Client()
+        # results are downloaded through the BigQuery Storage API when it is enabled, otherwise through the REST pager
+        if bqstorage_client is None and settings.CRON_BQ_STORAGE_API:
+            bqstorage_client = bigquery_storage_v1beta1.BigQueryStorageClient()
 
         # the earliest start date of all courses
         course_start_time = utils.find_earliest_start_datetime_of_courses()
 
-        # loop through multiple course ids, 20 at a time
-        # (This is set by the CRON_BQ_IN_LIMIT from settings)
-        for data_warehouse_course_ids in split_list(Course.objects.get_supported_courses(), settings.CRON_BQ_IN_LIMIT):
-            # query to retrieve all file access events for one course
-            # There is no catch if this query fails, event_store.events needs to exist
-
-            final_bq_query = []
-            for k, query_obj in settings.RESOURCE_ACCESS_CONFIG.items():
-                # concatenate the multi-line presentation of query into one single string
-                query = " ".join(query_obj['query'])
-
-                if (course_start_time is not None):
-                    # insert the start time parameter for query
-                    query += " and event_time > @course_start_time"
-
-                final_bq_query.append(query)
-            final_bq_query = "  UNION ALL   ".join(final_bq_query)
-
-            data_warehouse_course_ids_short = [db_util.incremented_id_to_canvas_id(id) for id in data_warehouse_course_ids]
-
-            logger.debug(final_bq_query)
-            logger.debug(data_warehouse_course_ids)
-            query_params = [
-                bigquery.ArrayQueryParameter('course_ids', 'STRING', data_warehouse_course_ids),
-                bigquery.ArrayQueryParameter('course_ids_short', 'STRING', data_warehouse_course_ids_short),
-                bigquery.ScalarQueryParameter('canvas_data_id_increment', 'INT64', settings.CANVAS_DATA_ID_INCREMENT)
-            ]
-            if (course_start_time is not None):
-                # insert the start time parameter for query
-                query_params.append(bigquery.ScalarQueryParameter('course_start_time', 'TIMESTAMP', course_start_time))
-
-            job_config = bigquery.QueryJobConfig()
-            job_config.query_parameters = query_params
-
-            # Location must match that of the dataset(s) referenced in the query.
-            bq_query = bigquery_client.query(final_bq_query, location='US', job_config=job_config)
-            #bq_query.result()
-            resource_access_df = bq_query.to_dataframe()
-            total_bytes_billed += bq_query.total_bytes_billed
-
-            logger.debug("df row number=" + str(resource_access_df.shape[0]))
-            # drop duplicates
-            resource_access_df.drop_duplicates(["resource_id", "user_id", "access_time"], keep='first', inplace=True)
-
-            logger.debug("after drop duplicates, df row number=" + str(resource_access_df.shape[0]))
-
-            logger.debug(resource_access_df)
-
-            # Because we're pulling all the data down into one query we need to manipulate it a little bit
-            # Make a copy of the access dataframe
-            resource_df = resource_access_df.copy(deep=True)
-            # Drop out the columns user and access time from resource data frame
-            resource_df.drop(["user_id", "access_time"], axis=1, inplace=True)
-            # Drop out the duplicates
-            resource_df.drop_duplicates(["resource_id", "course_id"], inplace=True)
-
-            # Drop out the columns resource_type, course_id, name from the resource_access
-            resource_access_df.drop(["resource_type","name", "course_id"], axis=1, inplace=True)
-
-            # Drop the columns where there is a Na value
-            resource_access_df_drop_na = resource_access_df.dropna()
-
-            logger.info(f"{len(resource_access_df) - len(resource_access_df_drop_na)} / {len(resource_access_df)} rows were dropped because of NA")
-
-            # First update the resource table
-            # write to MySQL
-            try:
-                resource_df.to_sql(con=engine, name='resource', if_exists='append', index=False)
-            except Exception as e:
-                logger.exception("Error running to_sql on table resource")
-                raise
-
-            try:
-                resource_access_df_drop_na.to_sql(con=engine, name='resource_access', if_exists='append', index=False)
-            except Exception as e:
-                logger.exception("Error running to_sql on table resource_access")
-                raise
-            return_string += str(resource_access_df_drop_na.shape[0]) + " rows for courses " + ",".join(map(str, data_warehouse_course_ids)) + "\n"
-            logger.info(return_string)
+        # the batch workers add their counters to this stage
+        stage_counters = get_metric_counters()
+
+        # query and load the access events of a batch of courses, returning its status and the bytes BigQuery billed
+        def load_batch(data_warehouse_course_ids):
+            batch_key = get_batch_key(data_warehouse_course_ids)
+            completed = cron_run.run_id is not None and CronCheckpoint.objects.is_completed(
+                cron_run.run_id, 'resource_access', batch_key)
+            if completed:
+                return (f"resource_access : {course_ids_string(data_warehouse_course_ids)} already loaded "
+                        f"in run {cron_run.run_id}\n"), 0, {}
+            if cron_run.resume and 'resource_access' in reloading_tables:
+                # rows a resumed run loaded for the batch before failing are deleted before it is loaded again
+                with load_lock:
+                    delete_course_resources(data_warehouse_course_ids)
+
+            with record_metrics('resource_access', data_warehouse_course_ids, stage_counters), \
+                    ExitStack() as batch_transaction:
+                # the last access_time loaded for each course in this batch, as naive UTC
+                watermarks = {}
+                if not full_reload:
+                    for data_warehouse_course_id in data_warehouse_course_ids:
+                        watermark = CronWatermark.objects.get_watermark('resource_access', data_warehouse_course_id)
+                        if watermark is not None:
+                            watermark = watermark.astimezone(pytz.UTC).replace(tzinfo=None)
+                            watermarks[data_warehouse_course_id] = pd.Timestamp(watermark)
+                # only query from the oldest watermark when every course in the batch has one
+                if len(watermarks) == len(data_warehouse_course_ids) and len(watermarks) > 0:
+                    batch_start_time = min(watermarks.values()).to_pydatetime().replace(tzinfo=pytz.UTC)
+                else:
+                    batch_start_time = course_start_time
+
+                # query to retrieve all file access events for one course
+                # There is no catch if this query fails, event_store.events needs to exist
+
+                data_warehouse_course_ids_short = [db_util.incremented_id_to_canvas_id(id)
+                                                   for id in data_warehouse_course_ids]
+
+                logger.debug(data_warehouse_course_ids)
+
+                # the query and its parameters for the events of a time window of the batch
+                def get_window_query(window_start_time, window_end_time):
+                    query_params = [
+                        bigquery.ArrayQueryParameter('course_ids', 'STRING', data_warehouse_course_ids),
+                        bigquery.ArrayQueryParameter('course_ids_short', 'STRING', data_warehouse_course_ids_short),
+                        bigquery.ScalarQueryParameter('canvas_data_id_increment', 'INT64',
+                                                      settings.CANVAS_DATA_ID_INCREMENT)
+                    ]
+                    if (window_start_time is not None):
+                        # insert the start time parameter for query
+                        query_params.append(bigquery.ScalarQueryParameter('course_start_time', 'TIMESTAMP',
+                                                                          window_start_time))
+                    if (window_end_time is not None):
+                        query_params.append(bigquery.ScalarQueryParameter('window_end_time', 'TIMESTAMP',
+                                                                          window_end_time))
+                    window_query = build_resource_access_query(window_start_time is not None,
+                                                               window_end_time is not None)
+                    return window_query, query_params
+
+                # the batch is queried in narrower time windows when its dry run estimate is over
+                # CRON_BQ_MAX_BYTES_BILLED, and fails before any job is started when they cannot bring it under the cap
+                try:
+                    time_windows = get_bq_time_windows(
+                        lambda window_start_time, window_end_time: estimate_bq_query_bytes(
+                            bigquery_client, *get_window_query(window_start_time, window_end_time)),
+                        batch_start_time)
+                except BigQueryCostError as e:
+                    raise BigQueryCostError(f"resource_access for courses "
+                                            f"{course_ids_string(data_warehouse_course_ids)}: {e}") from e
+                estimated_bytes = sum(window_bytes for window_start_time, window_end_time, window_bytes in time_windows)
+
+                query_start_time = time.perf_counter()
+                bq_queries = []
+                for window_start_time, window_end_time, window_bytes in time_windows:
+                    final_bq_query, query_params = get_window_query(window_start_time, window_end_time)
+                    logger.debug(final_bq_query)
+
+                    job_config = bigquery.QueryJobConfig()
+                    job_config.query_parameters = query_params
+                    if settings.CRON_BQ_MAX_BYTES_BILLED:
+                        # BigQuery fails the job instead of billing more than the cap
+                        job_config.maximum_bytes_billed = settings.CRON_BQ_MAX_BYTES_BILLED
+
+                    # Location must match that of the dataset(s) referenced in the query.
+                    bq_queries.append(bigquery_client.query(final_bq_query, location='US', job_config=job_config))
+
+                raw_mode = 'load' if full_reload else 'append'
+                # the extracts staged for the batch
+                staged_paths = []
+                if not full_reload:
+                    # the extracts of a batch that is rolled back are removed, so a replay does not load them either
+                    def remove_staged_extracts(exc_type, exc, traceback):
+                        if exc_type is not None:
+                            for path in filter(None, staged_paths):
+                                os.remove(path)
+
+                    # incremental batches append their raw rows, add their daily counts and move their watermarks in
+                    # one transaction, so a batch that fails before it commits, or is retried, does not load its events
+                    # twice. A resumed full reload deletes the rows the batch loaded before instead
+                    batch_transaction.push(remove_staged_extracts)
+                    batch_transaction.enter_context(transaction.atomic())
+                rows_extracted = 0
+                loaded_row_count = 0
+                raw_row_count = 0
+                dropped_row_count = 0
+                load_seconds = 0
+                course_events = Counter()
+                latest_access_times = {}
+                resource_frames = []
+                resource_access_daily_df = None
+                # each record batch is rolled up and its raw rows loaded as it arrives, so only the resources and
+                # the daily rollup of the batch of courses are kept in memory
+                for resource_access_df in read_resource_access_dataframes(bq_queries, bqstorage_client):
+                    rows_extracted += resource_access_df.shape[0]
+                    for course_id, event_count in resource_access_df['course_id'].value_counts().items():
+                        course_events[course_id] += event_count
+
+                    # The resources are the first access rows of each resource_id and course_id
+                    resource_frames.append(resource_access_df[resource_access_df['first_access'].astype(bool)]
+                                           [["resource_type", "resource_id", "course_id", "name"]])
+
+                    if watermarks:
+                        # the batch was queried from its oldest watermark, so drop the events each course already has
+                        course_watermarks = resource_access_df['course_id'].map(watermarks)
+                        is_new_access = resource_access_df['access_time'] > course_watermarks
+                        resource_access_df = resource_access_df[course_watermarks.isna() | is_new_access]
+
+                    # remember the latest access_time loaded for each course
+                    for course_id, access_time in resource_access_df.groupby('course_id')['access_time'].max().items():
+                        latest_access_time = latest_access_times.get(course_id)
+                        if pd.notna(access_time) and (latest_access_time is None or access_time > latest_access_time):
+                            latest_access_times[course_id] = access_time
+
+                    # Drop the rows where resource_id, user_id or access_time is missing
+                    resource_access_df_drop_na = resource_access_df.dropna(
+                        subset=["resource_id", "user_id", "access_time"])
+                    dropped_row_count += resource_access_df.shape[0] - resource_access_df_drop_na.shape[0]
+                    loaded_row_count += resource_access_df_drop_na.shape[0]
+
+                    # the daily rollup the views read, from which the raw events can be left out
+                    resource_access_daily_df = add_resource_access_daily(resource_access_daily_df,
+                                                                         resource_access_df_drop_na)
+
+                    if settings.RESOURCE_ACCESS_KEEP_RAW:
+                        # Keep only the columns resource_id, user_id, access_time for the resource_access
+                        resource_access_df_drop_na = resource_access_df_drop_na[
+                            ["resource_id", "user_id", "access_time"]]
+                        staged_paths.append(stage_extract(resource_access_df_drop_na, 'resource_access', raw_mode))
+                        with load_lock:
+                            load_start_time = time.perf_counter()
+                            try:
+                                if full_reload:
+                                    load_dataframe(resource_access_df_drop_na, get_load_table('resource_access'))
+                                else:
+                                    execute_dataframe(get_insert_sql(resource_access_df_drop_na, 'resource_access'),
+                                                      resource_access_df_drop_na)
+                            except Exception as e:
+                                logger.exception("Error loading table resource_access")
+                                raise
+                            load_seconds += time.perf_counter() - load_start_time
+                        raw_row_count += resource_access_df_drop_na.shape[0]
+
+                logger.debug("df row number=" + str(rows_extracted))
+                logger.info(f"{dropped_row_count} / {loaded_row_count + dropped_row_count} rows were dropped "
+                            f"because of NA")
+                if resource_access_daily_df is None:
+                    empty_df = pd.DataFrame({column: [] for column in RESOURCE_ACCESS_COLUMNS})
+                    resource_access_daily_df = get_resource_access_daily(compact_resource_access_dtypes(empty_df))
+
+                bytes_billed = sum(bq_query.total_bytes_billed or 0 for bq_query in bq_queries)
+                count_metrics(query_seconds=time.perf_counter() - query_start_time - load_seconds,
+                              rows_extracted=rows_extracted, bytes_billed=bytes_billed)
+                # the bytes billed for the batch are shared among its courses by their number of events
+                course_bytes_billed = {course_id: bytes_billed * course_events[course_id] / rows_extracted
+                                       if rows_extracted else 0
+                                       for course_id in data_warehouse_course_ids}
+
+                # Every time window and record batch of the batch has its own first accesses, so these few rows are
+                # deduplicated
+                if resource_frames:
+                    resource_df = (pd.concat(resource_frames, ignore_index=True)
+                                   .drop_duplicates(["resource_id", "course_id"]))
+                else:
+                    resource_df = pd.DataFrame({column: []
+                                                for column in ["resource_type", "resource_id", "course_id", "name"]})
+
+                if not full_reload:
+                    # only add the resources that are not in the table yet. Batches hold different courses,
+                    # so the other workers don't add resources of this batch
+                    existing_resource_df = pd.read_sql(
+                        "select resource_id, course_id from resource where course_id in %(course_ids)s",
+                        db_util.get_engine(), params={'course_ids': tuple(data_warehouse_course_ids)})
+                    existing_resources = set(zip(existing_resource_df['resource_id'].astype(str),
+                                                 existing_resource_df['course_id']))
+                    is_new_resource = pd.Series([(str(resource_id), course_id) not in existing_resources
+                                                 for resource_id, course_id in zip(resource_df['resource_id'],
+                                                                                   resource_df['course_id'])],
+                                                index=resource_df.index, dtype=bool)
+                    resource_df = resource_df[is_new_resource]
+
+                # move the watermark of each course of the batch to the latest access_time loaded
+                def set_watermarks():
+                    if not settings.CRON_INCREMENTAL:
+                        return
+                    for data_warehouse_course_id in data_warehouse_course_ids:
+                        latest_access_time = latest_access_times.get(data_warehouse_course_id)
+                        if pd.notna(latest_access_time):
+                            watermark = pd.Timestamp(latest_access_time).to_pydatetime().replace(tzinfo=pytz.UTC)
+                        elif full_reload:
+                            watermark = None
+                        else:
+                            # nothing new for this course
+                            continue
+                        CronWatermark.objects.set_watermark('resource_access', data_warehouse_course_id, watermark,
+                                                            full_load_time=run_start_time if full_reload else None)
+
+                stage_extract(resource_df, 'resource', 'load' if full_reload else 'append')
+
+                # write to MySQL
+                with load_lock:
+                    try:
+                        load_dataframe(resource_df, get_load_table('resource'))
+                    except Exception as e:
+                        logger.exception("Error loading table resource")
+                        raise
+
+                    load_start_time = time.perf_counter()
+                    if full_reload:
+                        load_dataframe(resource_access_daily_df, get_load_table('resource_access_daily'))
+                        set_watermarks()
+                    else:
+                        # the counts are added to the rows of earlier runs in the batch transaction, which moves the
+                        # watermarks past their events
+                        execute_dataframe(get_upsert_sql(resource_access_daily_df, 'resource_access_daily',
+                                                         RESOURCE_ACCESS_DAILY_UPDATES), resource_access_daily_df)
+                        set_watermarks()
+                    load_seconds += time.perf_counter() - load_start_time
+                staged_paths.append(stage_extract(resource_access_daily_df, 'resource_access_daily',
+                                                  'load' if full_reload else 'add'))
+                count_metrics(rows_loaded=resource_df.shape[0] + resource_access_daily_df.shape[0] + raw_row_count)
+                batch_status = (f"{loaded_row_count} rows for courses {course_ids_string(data_warehouse_course_ids)}"
+                                f" ({resource_access_daily_df.shape[0]} daily rows, "
+                                f"{load_rate_string(loaded_row_count, load_seconds)}; "
+                                f"{len(time_windows)} time window(s), {bq_cost_string(estimated_bytes)} estimated, "
+                                f"{bq_cost_string(bytes_billed)} billed)\n")
+                logger.info(batch_status)
+
+            # the three tables keep the batch when the run is resumed
+            if cron_run.run_id is not None:
+                CronCheckpoint.objects.mark_completed(cron_run.run_id, 'resource', batch_key)
+                CronCheckpoint.objects.mark_completed(cron_run.run_id, 'resource_access', batch_key)
+                CronCheckpoint.objects.mark_completed(cron_run.run_id, 'resource_access_daily', batch_key)
+            return batch_status, bytes_billed, course_bytes_billed
+
+        # up to CRON_BQ_MAX_CONCURRENT_JOBS batches run at once, and their results are collected as they finish
+        course_id_batches = get_bq_course_batches(loaded_course_ids, course_event_counts)
+        if settings.CRON_BQ_MAX_CONCURRENT_JOBS <= 1:
+            batch_results = [load_batch(data_warehouse_course_ids) for data_warehouse_course_ids in course_id_batches]
+        else:
+            with ThreadPoolExecutor(max_workers=settings.CRON_BQ_MAX_CONCURRENT_JOBS) as executor:
+                batch_futures = [executor.submit(run_in_worker, load_batch, data_warehouse_course_ids)
+                                 for data_warehouse_course_ids in course_id_batches]
+                batch_results = [batch_future.result() for batch_future in as_completed(batch_futures)]
+        status += "".join(batch_status for batch_status, bytes_billed, batch_course_bytes in batch_results)
+        # the cost of each course, the most expensive first
+        course_bytes_billed = {course_id: course_bytes
+                               for batch_status, bytes_billed, batch_course_bytes in batch_results
+                               for course_id, course_bytes in batch_course_bytes.items()}
+        for course_id in sorted(course_bytes_billed, key=course_bytes_billed.get, reverse=True):
+            status += f"BQ cost of course {course_id}: {bq_cost_string(course_bytes_billed[course_id])}\n"
+        # BQ Total Bytes Billed to report to status
+        total_bytes_billed = sum(bytes_billed for batch_status, bytes_billed, batch_course_bytes in batch_results)
 
         total_tbytes_billed = total_bytes_billed / 1024 / 1024 / 1024 / 1024
-        # $5 per TB as of Feb 2019 https://cloud.google.com/bigquery/pricing
-        total_tbytes_price = round(5 * total_tbytes_billed, 2)
+        # priced at CRON_BQ_PRICE_PER_TB, see https://cloud.google.com/bigquery/pricing
+        total_tbytes_price = round(settings.CRON_BQ_PRICE_PER_TB * total_tbytes_billed, 2)
         status +=(f"TBytes billed for BQ: {total_tbytes_billed} = ${total_tbytes_price}\n")
+        status += finish_table_reload("resource")
+        status += finish_table_reload("resource_access")
+        status += finish_table_reload("resource_access_daily")
         return status
 
 
-    def update_groups(self):
+    def update_groups(self, data_warehouse_course_ids=None):
         # cron status
         status =""
 
         # delete all records in assignment_group table
-        status += deleteAllRecordInTable("assignment_groups")
+        status += start_course_reload("assignment_groups", data_warehouse_course_ids)
 
         # update groups
         #Loading the assignment groups inforamtion along with weight/points associated ith arn assignment
         logger.debug("update_assignment_groups(): ")
 
-        # loop through multiple course ids
-        for data_warehouse_course_id in Course.objects.get_supported_courses():
-            assignment_groups_sql= f"""with assignment_details as (select ad.due_at,ad.title,af.course_id ,af.assignment_id,af.points_possible,af.assignment_group_id from assignment_fact af inner join assignment_dim ad on af.assignment_id = ad.id where af.course_id='{data_warehouse_course_id}' and ad.visibility = 'everyone' and ad.workflow_state='published'),
-            assignment_grp as (select agf.*, agd.name from assignment_group_dim agd join assignment_group_fact agf on agd.id = agf.assignment_group_id  where agd.course_id='{data_warehouse_course_id}' and workflow_state='available'),
-            assign_more as (select distinct(a.assignment_group_id) ,da.group_points from assignment_details a join (select assignment_group_id, sum(points_possible) as group_points from assignment_details group by assignment_group_id) as da on a.assignment_group_id = da.assignment_group_id ),
-            grp_full as (select a.group_points, b.assignment_group_id from assign_more a right join assignment_grp b on a.assignment_group_id = b.assignment_group_id),
-            assign_rules as (select DISTINCT ad.assignment_group_id,agr.drop_lowest,agr.drop_highest from grp_full ad join assignment_group_rule_dim agr on ad.assignment_group_id=agr.assignment_group_id),
-            assignment_grp_points as (select ag.*, am.group_points AS group_points from assignment_grp ag join grp_full am on ag.assignment_group_id = am.assignment_group_id),
-            assign_final as (select assignment_group_id AS id, course_id AS course_id, group_weight AS weight, name AS name, group_points AS group_points from assignment_grp_points)
-            select g.*, ar.drop_lowest,ar.drop_highest from assign_rules ar join assign_final g on ar.assignment_group_id=g.id;
-                                   """
-            status += util_function(data_warehouse_course_id, assignment_groups_sql, 'assignment_groups')
-
+        assignment_groups_sql = """with assignment_details as (select ad.due_at,ad.title,af.course_id ,af.assignment_id,
+                                                           af.points_possible,af.assignment_group_id
+                                                           from assignment_fact af
+                                                           inner join assignment_dim ad on af.assignment_id = ad.id
+                                                           where af.course_id in %(course_ids)s
+                                                           and ad.visibility = 'everyone'
+                                                           and ad.workflow_state='published'),
+        assignment_grp as (select agf.*, agd.name from assignment_group_dim agd
+                           join assignment_group_fact agf on agd.id = agf.assignment_group_id
+                           where agd.course_id in %(course_ids)s and workflow_state='available'),
+        assign_more as (select distinct(a.assignment_group_id) ,da.group_points from assignment_details a
+                        join (select assignment_group_id, sum(points_possible) as group_points
+                              from assignment_details group by assignment_group_id) as da
+                        on a.assignment_group_id = da.assignment_group_id ),
+        grp_full as (select a.group_points, b.assignment_group_id from assign_more a
+                     right join assignment_grp b on a.assignment_group_id = b.assignment_group_id),
+        assign_rules as (select DISTINCT ad.assignment_group_id,agr.drop_lowest,agr.drop_highest from grp_full ad
+                         join assignment_group_rule_dim agr on ad.assignment_group_id=agr.assignment_group_id),
+        assignment_grp_points as (select ag.*, am.group_points AS group_points from assignment_grp ag
+                                  join grp_full am on ag.assignment_group_id = am.assignment_group_id),
+        assign_final as (select assignment_group_id AS id, course_id AS course_id, group_weight AS weight, name AS name,
+                         group_points AS group_points from assignment_grp_points)
+        select distinct g.*, ar.drop_lowest,ar.drop_highest from assign_rules ar
+        join assign_final g on ar.assignment_group_id=g.id;
+                               """
+
+        # loop through batches of course ids
+        status += run_course_batches(
+            lambda data_warehouse_course_ids: util_function(data_warehouse_course_ids, assignment_groups_sql,
+                                                            'assignment_groups',
+                                                            params={'course_ids': tuple(data_warehouse_course_ids)}),
+            get_course_id_batches(data_warehouse_course_ids), 'assignment_groups')
+
+        status += finish_course_reload("assignment_groups", data_warehouse_course_ids)
         return status
 
 
-    def update_assignment(self):
+    def update_assignment(self, data_warehouse_course_ids=None):
         #Load the assignment info w.r.t to a course such as due_date, points etc
         status =""
 
         logger.info("update_assignment(): ")
 
+        # refreshed courses are always reloaded in full
+        if settings.CRON_INCREMENTAL and data_warehouse_course_ids is None:
+            # assignments are upserted based on assignment_dim.updated_at. assignment_fact has no update time, so
+            # changes only made there (points_possible, assignment_group_id) are loaded when the course is refreshed
+            status += run_course_batches(
+                lambda data_warehouse_course_ids: incremental_util_function(
+                    data_warehouse_course_ids, get_assignment_sql, "ad.updated_at > %(watermark)s", "af.assignment_id",
+                    "af.course_id", 'assignment', 'updated_at', extra_columns=('updated_at',)),
+                get_course_id_batches(), 'assignment')
+            return status
+
         # delete all records in assignment table
-        status += deleteAllRecordInTable("assignment")
+        status += start_course_reload("assignment", data_warehouse_course_ids)
 
-        # loop through multiple course ids
-        for data_warehouse_course_id in Course.objects.get_supported_courses():
-            assignment_sql = f"""with assignment_info as
-                            (select ad.due_at AS due_date,ad.due_at at time zone 'utc' at time zone '{settings.TIME_ZONE}' as local_date,
-                            ad.title AS name,af.course_id AS course_id,af.assignment_id AS id,
-                            af.points_possible AS points_possible,af.assignment_group_id AS assignment_group_id
-                            from assignment_fact af inner join assignment_dim ad on af.assignment_id = ad.id where af.course_id='{data_warehouse_course_id}'
-                            and ad.visibility = 'everyone' and ad.workflow_state='published')
-                            select * from assignment_info
-                            """
-            status += util_function(data_warehouse_course_id, assignment_sql,'assignment')
+        # loop through batches of course ids
+        status += run_course_batches(
+            lambda data_warehouse_course_ids: util_function(data_warehouse_course_ids, get_assignment_sql(),
+                                                            'assignment',
+                                                            params={'course_ids': tuple(data_warehouse_course_ids)}),
+            get_course_id_batches(data_warehouse_course_ids), 'assignment')
 
+        status += finish_course_reload("assignment", data_warehouse_course_ids)
         return status
 
 
-    def submission(self):
+    def submission(self, data_warehouse_course_ids=None):
         #student submission information for assignments
         # cron status
         status = ""
 
         logger.info("update_submission(): ")
 
+        # refreshed courses are always reloaded in full
+        if settings.CRON_INCREMENTAL and data_warehouse_course_ids is None:
+            # submissions are upserted when graded or posted after the last graded date loaded for the course
+            status += run_course_batches(
+                lambda data_warehouse_course_ids: incremental_util_function(
+                    data_warehouse_course_ids, get_submission_sql,
+                    "sd.graded_at > %(watermark)s or sd.posted_at > %(watermark)s", "sd.id", "suf.course_id",
+                    'submission', 'graded_date'),
+                get_course_id_batches(), 'submission')
+            return status
+
         # delete all records in resource_access table
-        status += deleteAllRecordInTable("submission")
-
-        # loop through multiple course ids
-        for data_warehouse_course_id in Course.objects.get_supported_courses():
-            submission_url = f"""with sub_fact as (select submission_id, assignment_id, course_id, user_id, global_canvas_id, published_score from submission_fact sf join user_dim u on sf.user_id = u.id where course_id = '{data_warehouse_course_id}'),
-                enrollment as (select  distinct(user_id) from enrollment_dim where course_id = '{data_warehouse_course_id}' and workflow_state='active' and type = 'StudentEnrollment'),
-                sub_with_enroll as (select sf.* from sub_fact sf join enrollment e on e.user_id = sf.user_id),
-                submission_time as (select sd.id, sd.graded_at, sd.posted_at at time zone 'utc' at time zone '{settings.TIME_ZONE}' as grade_posted_local_date from submission_dim sd join sub_fact suf on sd.id=suf.submission_id where posted_at is not null and posted_at < getdate()),
-                assign_fact as (select s.*,a.title from assignment_dim a join sub_with_enroll s on s.assignment_id=a.id where a.course_id='{data_warehouse_course_id}' and a.workflow_state='published'),
-                assign_sub_time as (select a.*, t.graded_at, t.grade_posted_local_date from assign_fact a join submission_time t on a.submission_id = t.id),
-                all_assign_sub as (select submission_id AS id, assignment_id AS assignment_id, course_id, global_canvas_id AS user_id, round(published_score,1) AS score, graded_at AS graded_date, grade_posted_local_date from assign_sub_time order by assignment_id)
-                select f.*, f1.avg_score from all_assign_sub f join (select assignment_id, round(avg(score),1) as avg_score from all_assign_sub group by assignment_id) as f1 on f.assignment_id = f1.assignment_id;
-          """
-            status += util_function(data_warehouse_course_id, submission_url,'submission')
+        status += start_course_reload("submission", data_warehouse_course_ids)
 
+        # loop through batches of course ids
+        status += run_course_batches(
+            lambda data_warehouse_course_ids: util_function(data_warehouse_course_ids, get_submission_sql(),
+                                                            'submission',
+                                                            params={'course_ids': tuple(data_warehouse_course_ids)}),
+            get_course_id_batches(data_warehouse_course_ids), 'submission')
+
+        status += finish_course_reload("submission", data_warehouse_course_ids)
         return status
 
 
-    def weight_consideration(self):
+    # score statistics of every assignment, computed from the loaded submissions so views don't aggregate them
+    # per request
+    def update_assignment_score_stats(self, data_warehouse_course_ids=None):
+        # cron status
+        status = ""
+
+        logger.info("update_assignment_score_stats(): ")
+
+        # delete all records in assignment_score_stats table
+        status += start_course_reload("assignment_score_stats", data_warehouse_course_ids)
+
+        # loop through batches of course ids
+        status += run_course_batches(load_assignment_score_stats, get_course_id_batches(data_warehouse_course_ids),
+                                     'assignment_score_stats')
+
+        status += finish_course_reload("assignment_score_stats", data_warehouse_course_ids)
+        return status
+
+
+    def weight_consideration(self, data_warehouse_course_ids=None):
         #load the assignment weight consider information with in a course. Some assignments don't have weight consideration
         #the result of it return boolean indicating weight is considered in table calculation or not
         status =""
@@ -419,18 +1942,26 @@ def weight_consideration(self):
         logger.info("weight_consideration()")
 
         # delete all records in assignment_weight_consideration table
-        status += deleteAllRecordInTable("assignment_weight_consideration")
+        status += start_course_reload("assignment_weight_consideration", data_warehouse_course_ids)
+
+        # weight is considered when the group weights of a course add up to more than 1
+        is_weight_considered_url = """select c.id as course_id,
+                                      CASE WHEN sum(agf.group_weight) > 1 THEN CAST(1 AS BOOLEAN)
+                                      ELSE CAST(0 AS BOOLEAN) END as consider_weight
+                                      from course_dim c left join assignment_group_fact agf on agf.course_id = c.id
+                                      where c.id in %(course_ids)s group by c.id
+                                   """
 
-        # loop through multiple course ids
-        for data_warehouse_course_id in Course.objects.get_supported_courses():
-            is_weight_considered_url = f"""with course as (select course_id, sum(group_weight) as group_weight from assignment_group_fact
-                                        where course_id = '{data_warehouse_course_id}' group by course_id having sum(group_weight)>1)
-                                        (select CASE WHEN EXISTS (SELECT * FROM course WHERE group_weight > 1) THEN CAST(1 AS BOOLEAN) ELSE CAST(0 AS BOOLEAN) END)
-                                        """
-            status += util_function(data_warehouse_course_id, is_weight_considered_url,'assignment_weight_consideration', 'weight')
+        # loop through batches of course ids
+        status += run_course_batches(
+            lambda data_warehouse_course_ids: util_function(data_warehouse_course_ids, is_weight_considered_url,
+                                                            'assignment_weight_consideration',
+                                                            params={'course_ids': tuple(data_warehouse_course_ids)}),
+            get_course_id_batches(data_warehouse_course_ids), 'assignment_weight_consideration')
 
-            logger.debug(status+"\n\n")
+        logger.debug(status+"\n\n")
 
+        status += finish_course_reload("assignment_weight_consideration", data_warehouse_course_ids)
         return status
 
 
@@ -441,13 +1972,14 @@ def update_term(self):
         logger.debug("in update with data warehouse term")
 
         # delete all records in the table first
-        status += deleteAllRecordInTable("academic_terms")
+        status += start_table_reload("academic_terms")
 
         # select term records from DATA_WAREHOUSE
-        term_sql = "SELECT id, canvas_id, name, date_start, date_end FROM enrollment_term_dim;"
+        term_sql = "SELECT DISTINCT id, canvas_id, name, date_start, date_end FROM enrollment_term_dim;"
         logger.debug(term_sql)
         status += util_function(None, term_sql, 'academic_terms')
 
+        status += finish_table_reload("academic_terms")
         return status
 
 
@@ -458,40 +1990,131 @@ def update_course(self, warehouse_courses_data):
         logger.debug("while using verify_course_ids data to update course table")
 
         logger.debug(warehouse_courses_data.to_json(orient='records'))
-        courses = Course.objects.all()
+        courses = list(Course.objects.all())
         courses_string = ", ".join([str(x) for x in Course.objects.get_supported_courses()])
         status += f"{str(len(courses))} course(s): {courses_string}\n"
 
+        warehouse_courses = {warehouse_course["id"]: warehouse_course
+                             for warehouse_course in warehouse_courses_data.to_dict(orient='records')}
+        term_ids = {warehouse_course["enrollment_term_id"] for warehouse_course in warehouse_courses.values()}
+        terms = AcademicTerms.objects.in_bulk([term_id for term_id in term_ids if pd.notna(term_id)])
+
+        # courses to save, by the tuple of fields that changed
+        updated_courses = {}
         for course in courses:
             updated_fields = []
             status += f"course {course.id}: updated "
-            warehouse_course_df = warehouse_courses_data.loc[warehouse_courses_data["id"] == course.id]
+            warehouse_course = warehouse_courses[course.id]
 
-            warehouse_course_name = warehouse_course_df["name"].iloc[0]
+            warehouse_course_name = warehouse_course["name"]
             if course.name != warehouse_course_name:
                 course.name = warehouse_course_name
                 logger.info(f"Name for {course.id} has been updated.")
                 updated_fields.append("name")
 
-            # term is always updated because the term records are deleted by the update_term method
-            course.term = AcademicTerms.objects.get(id=warehouse_course_df["enrollment_term_id"])
-            logger.info(f"Term for {course.id} has been updated.")
-            updated_fields.append("term")
+            term = terms.get(warehouse_course["enrollment_term_id"])
+            if term is None:
+                logger.error(f"Term {warehouse_course['enrollment_term_id']} of course {course.id} was not found.")
+            elif course.term_id != term.id:
+                course.term = term
+                logger.info(f"Term for {course.id} has been updated.")
+                updated_fields.append("term")
 
-            updated_fields += update_datetime_field(course, "date_start", warehouse_course_df, "start_at")
-            updated_fields += update_datetime_field(course, "date_end", warehouse_course_df, "conclude_at")
+            updated_fields += update_datetime_field(course, "date_start", warehouse_course["start_at"])
+            updated_fields += update_datetime_field(course, "date_end", warehouse_course["conclude_at"])
 
-            course.save()
+            if updated_fields:
+                updated_courses.setdefault(tuple(updated_fields), []).append(course)
             status += ", ".join(updated_fields) + "\n"
+
+        for updated_fields, courses_to_update in updated_courses.items():
+            Course.objects.bulk_update(courses_to_update, updated_fields)
+        return status
+
+
+    # the stages of a run with the tables they read and write, listed in the order they run one at a time
+    def get_stages(self, warehouse_courses_data):
+        stages = [CronStage("term", self.update_term, (), ("academic_terms",), False)]
+
+        if len(Course.objects.get_supported_courses()) == 0:
+            logger.info("Skipping course-related table updates...")
+            stages.append(CronStage("skip courses", lambda: "Skipped course-related table updates.\n", (), (), False))
+        else:
+            stages += [
+                CronStage("course", lambda: self.update_course(warehouse_courses_data), ("academic_terms",),
+                          ("course",), False),
+                CronStage("user", self.update_user, (), ("user",), False),
+                CronStage("groups", self.update_groups, (), ("assignment_groups",), False),
+                CronStage("assignment", self.update_assignment, (), ("assignment",), False),
+                CronStage("submission", self.submission, (), ("submission",), False),
+                CronStage("score stats", self.update_assignment_score_stats, ("submission",),
+                          ("assignment_score_stats",), False),
+                CronStage("weight", self.weight_consideration, (), ("assignment_weight_consideration",), False),
+            ]
+            if 'show_resources_accessed' not in settings.VIEWS_DISABLED:
+                # the BigQuery stages only need the course start dates, so they overlap with the warehouse stages
+                stages += [
+                    CronStage("bq access", self.update_with_bq_access, ("course",),
+                              ("resource", "resource_access", "resource_access_daily"), True),
+                    CronStage("canvas resource", self.update_canvas_resource, ("resource",), ("resource",), True),
+                ]
+
+        if settings.DATA_WAREHOUSE_IS_UNIZIN:
+            stages.append(CronStage("unizin metadata", self.update_unizin_metadata, (), ("unizin_metadata",), False))
+        return stages
+
+
+    # reload the user, assignment, submission, weight and resource access rows of the given courses only, leaving
+    # the rows of the other courses in place. Used by the refresh_course command and the course admin action
+    def refresh_courses(self, data_warehouse_course_ids):
+        logger.info(f"** MyLA course refresh {course_ids_string(data_warehouse_course_ids)}")
+
+        status = ""
+
+        status += "Start course refresh: " + str(datetime.datetime.now()) + "\n"
+        start_unrecorded_run()
+
+        with hold_cron_lease() as lease_holder:
+            if lease_holder is None:
+                raise CronLeaseError(f"another cron run is loading the MyLA tables: "
+                                     f"{CronLease.objects.filter(name=CRON_LEASE_NAME).first()}")
+            status += self.update_user(data_warehouse_course_ids)
+            status += self.update_groups(data_warehouse_course_ids)
+            status += self.update_assignment(data_warehouse_course_ids)
+            status += self.submission(data_warehouse_course_ids)
+            status += self.update_assignment_score_stats(data_warehouse_course_ids)
+            status += self.weight_consideration(data_warehouse_course_ids)
+            if 'show_resources_accessed' not in settings.VIEWS_DISABLED:
+                status += self.update_with_bq_access(data_warehouse_course_ids=data_warehouse_course_ids)
+                status += self.update_canvas_resource(data_warehouse_course_ids)
+
+        status += "End course refresh: " + str(datetime.datetime.now()) + "\n"
+
+        logger.info("************ total status=" + status + "\n")
+
         return status
 
 
+    # run the cron job while holding the cron lease. Without the lease another cron pod is running it, so this run is
+    # skipped and the pods can be scaled as hot standbys
     def do(self):
+        with hold_cron_lease() as lease_holder:
+            if lease_holder is None:
+                status = (f"Skipped cron: another cron run holds the lease "
+                          f"({CronLease.objects.filter(name=CRON_LEASE_NAME).first()})\n")
+                logger.info(status)
+                return status
+            return self.run_cron()
+
+
+    def run_cron(self):
         logger.info("** MyLA cron tab")
 
         status = ""
 
         status += "Start cron: " +  str(datetime.datetime.now()) + "\n"
+        status += start_cron_run(self.resume)
+        status += start_staging_run()
 
         course_verification = self.verify_course_ids()
         invalid_course_id_list = course_verification.invalid_course_ids
@@ -504,41 +2127,100 @@ def do(self):
             return (status,)
 
         # continue cron tasks
+        status += run_stage_graph(self.get_stages(course_verification.course_data))
+        CronCheckpoint.objects.finish_run(cron_run.run_id)
 
-        logger.info("** term")
-        status += self.update_term()
+        status += "End cron: " +  str(datetime.datetime.now()) + "\n"
 
-        if len(Course.objects.get_supported_courses()) == 0:
-            logger.info("Skipping course-related table updates...")
-            status += "Skipped course-related table updates.\n"
-        else:
-            logger.info("** course")
-            status += self.update_course(course_verification.course_data)
+        logger.info("************ total status=" + status + "\n")
 
-            logger.info("** user")
-            status += self.update_user()
+        return status
 
-            logger.info("** assignment")
-            status += self.update_groups()
-            status += self.update_assignment()
 
-            status += self.submission()
-            status += self.weight_consideration()
+# replay the extracts staged by DashboardCronJob into MySQL without a warehouse or BigQuery connection, to rerun
+# or benchmark the load phase on its own:
+#   python manage.py runcrons dashboard.cron.DashboardReplayCronJob --force
+class DashboardReplayCronJob(DashboardCronJob):
 
-            logger.info("** file")
-            if 'show_resources_accessed' not in settings.VIEWS_DISABLED:
-                try:
-                    status += self.update_with_bq_access()
-                    status += self.update_canvas_resource()
-                except Exception as e:
-                    logger.exception("Exception running BigQuery update")
+    code = 'dashboard.DashboardReplayCronJob'    # a unique code
 
-        if settings.DATA_WAREHOUSE_IS_UNIZIN:
-            logger.info("** informational")
-            status += self.update_unizin_metadata()
+    # staged stages in the order DashboardCronJob loads them
+    REPLAY_STAGES = ["academic_terms", "course_dim", "user", "assignment_groups", "assignment", "submission",
+                     "assignment_weight_consideration", "resource", "resource_access", "resource_access_daily",
+                     "file_dim", "unizin_metadata"]
 
-        status += "End cron: " +  str(datetime.datetime.now()) + "\n"
+
+    # apply the staged files of a table the way the cron run applied them
+    def replay_table(self, table_name, staged_extracts):
+        status = ""
+        modes = {mode for mode, path in staged_extracts}
+
+        if 'load' in modes:
+            status += start_table_reload(table_name)
+
+        row_count = 0
+        load_seconds = 0
+        for mode, path in staged_extracts:
+            df = read_staged_extract(path)
+            if mode == 'load':
+                load_seconds += load_table_rows(df, table_name)[1]
+            elif mode == 'append':
+                load_seconds += load_dataframe(df, get_load_table(table_name))
+            elif mode == 'upsert':
+                upsert_dataframe(df, table_name)
+            elif mode == 'add':
+                upsert_dataframe(df, table_name, RESOURCE_ACCESS_DAILY_UPDATES)
+            elif mode == 'delete':
+                delete_rows_by_id(table_name, df['id'])
+            row_count += df.shape[0]
+
+        status += f"{row_count} {table_name} replayed ({load_rate_string(row_count, load_seconds)})\n"
+        if 'load' in modes:
+            status += finish_table_reload(table_name)
+        # the score statistics are not staged, they are computed again from the replayed submissions
+        if table_name == 'submission':
+            status += self.update_assignment_score_stats()
+        return status
+
+
+    def run_cron(self):
+        logger.info("** MyLA cron replay")
+
+        status = ""
+
+        status += "Start cron replay: " + str(datetime.datetime.now()) + "\n"
+        start_unrecorded_run()
+
+        # the latest staged run is replayed unless CRON_REPLAY_DATE names one
+        replay_run_dir = None
+        if settings.CRON_STAGING_DIR and os.path.isdir(settings.CRON_STAGING_DIR):
+            run_dates = sorted(os.listdir(settings.CRON_STAGING_DIR))
+            replay_date = settings.CRON_REPLAY_DATE or (run_dates[-1] if run_dates else None)
+            if replay_date is not None:
+                replay_run_dir = os.path.join(settings.CRON_STAGING_DIR, replay_date)
+        if replay_run_dir is None or not os.path.isdir(replay_run_dir):
+            status += f"ERROR: no staged extracts found in CRON_STAGING_DIR {settings.CRON_STAGING_DIR}\n"
+            logger.info("************ total status=" + status + "\n")
+            return status
+        status += f"replaying extracts from {replay_run_dir}\n"
+
+        for stage in self.REPLAY_STAGES:
+            staged_extracts = list_staged_extracts(replay_run_dir, stage)
+            if not staged_extracts:
+                continue
+            logger.info(f"** {stage}")
+            if stage == 'course_dim':
+                status += self.update_course(pd.concat([read_staged_extract(path) for mode, path in staged_extracts]))
+            elif stage == 'file_dim':
+                df_attach = pd.concat([read_staged_extract(path) for mode, path in staged_extracts])
+                updated_count, removed_count = apply_file_states(df_attach)
+                status += f"{len(df_attach)} files in file_dim : {updated_count} resource names updated, " \
+                          f"{removed_count} unavailable resources removed\n"
+            else:
+                status += self.replay_table(stage, staged_extracts)
+
+        status += "End cron replay: " + str(datetime.datetime.now()) + "\n"
 
         logger.info("************ total status=" + status + "\n")
 
-        return status
\ No newline at end of file
+        return status
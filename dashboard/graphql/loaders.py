@@ -6,7 +6,7 @@
 
 from dashboard.models import Course, User, Assignment, Submission, \
     AssignmentGroups, AssignmentWeightConsideration, UserDefaultSelection, \
-    AcademicTerms
+    AcademicTerms, AssignmentScoreStats
 
 import logging
 logger = logging.getLogger(__name__)
@@ -86,6 +86,15 @@ def batch_load_fn(self, keys):
 
         return Promise.resolve([results.get(key, []) for key in keys])
 
+class AssignmentScoreStatsByAssignmentIdLoader(DataLoader):
+    def batch_load_fn(self, keys):
+        results = defaultdict(None)
+
+        for result in AssignmentScoreStats.objects.filter(assignment_id__in=keys).iterator():
+            results[result.assignment_id] = result
+
+        return Promise.resolve([results.get(key, None) for key in keys])
+
 class SubmissionByAssignmentIdAndUserIdLoader(DataLoader):
     # overwrite get_cache_key since it doesn't handle dictionaries
     def get_cache_key(self, key):  # type: ignore
@@ -1,6 +1,5 @@
 from graphene_django import DjangoObjectType
 import graphene
-import numpy as np
 import json
 
 from graphql import GraphQLError
@@ -122,24 +121,15 @@ def resolve_assignment_group(parent, info):
             'id': parent.assignment_group_id,
         })
 
-    def _average_grade_lambda(parent, info, submissions):
-        if len(submissions) > 0:
-            return np.average([submission.score if submission.score else 0 for submission in submissions])
-        return 0
-
+    # the grade statistics are precomputed by the cron job in assignment_score_stats
     def resolve_average_grade(parent, info):
-        return info.context.submissions_by_assignment_id_loader.load(parent.id).then(
-            lambda submissions: AssignmentType._average_grade_lambda(parent, info, submissions)
+        return info.context.assignment_score_stats_by_assignment_id_loader.load(parent.id).then(
+            lambda score_stats: score_stats.mean if score_stats else 0
         )
 
-    def _median_grade_lambda(parent, info, submissions):
-        if len(submissions) > 0:
-            return np.median([submission.score if submission.score else 0 for submission in submissions])
-        return 0
-
     def resolve_median_grade(parent, info):
-        return info.context.submissions_by_assignment_id_loader.load(parent.id).then(
-            lambda submissions: AssignmentType._median_grade_lambda(parent, info, submissions)
+        return info.context.assignment_score_stats_by_assignment_id_loader.load(parent.id).then(
+            lambda score_stats: score_stats.median if score_stats else 0
         )
 
     class Meta:
@@ -7,7 +7,7 @@
     AssignmentByAssignmentGroupIdAndIdLoader, AssignmentGroupsByCourseIdLoader, \
     AssignmentGroupByCourseIdAndIdLoader, AssignmentWeightConsiderationByCourseIdLoader, \
     UserDefaultSelectionsByCourseIdAndUserLoader, UserDefaultSelectionByCourseIdAndUserAndViewTypeLoader, \
-    AcademicTermByIdLoader
+    AcademicTermByIdLoader, AssignmentScoreStatsByAssignmentIdLoader
 
 from django.db.models import Q
 from dashboard.models import User
@@ -27,6 +27,7 @@ def get_context(self, request):
             'assignments_by_assignment_group_id_loader': AssignmentsByAssignmentGroupIdLoader(),
             'submissions_by_assignment_id_loader': SubmissionsByAssignmentIdLoader(),
             'submission_by_assignment_id_and_user_id_loader': SubmissionByAssignmentIdAndUserIdLoader(),
+            'assignment_score_stats_by_assignment_id_loader': AssignmentScoreStatsByAssignmentIdLoader(),
             'assignment_groups_by_course_id_loader': AssignmentGroupsByCourseIdLoader(),
             'assignment_group_by_course_id_and_id_loader': AssignmentGroupByCourseIdAndIdLoader(),
             'user_default_selections_by_course_id_and_user_loader': UserDefaultSelectionsByCourseIdAndUserLoader(),
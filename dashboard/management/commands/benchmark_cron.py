@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import cron
+from dashboard.common import warehouse_simulator
+from dashboard.common.db_util import get_engine
+from dashboard.models import Course, CronStageMetric
+
+
+# the cron job reading access events from the simulator instead of BigQuery
+class SimulatedCronJob(cron.DashboardCronJob):
+
+    scale = warehouse_simulator.DEFAULT_SCALE
+
+    def update_with_bq_access(self, bigquery_client=None, bqstorage_client=None, data_warehouse_course_ids=None):
+        bigquery_client = warehouse_simulator.FakeBigQueryClient(self.scale)
+        bqstorage_client = warehouse_simulator.FakeBigQueryStorageClient(bigquery_client)
+        return super().update_with_bq_access(bigquery_client, bqstorage_client, data_warehouse_course_ids)
+
+
+class Command(BaseCommand):
+    help = ("Run the cron job end to end against a simulated warehouse and report the time of every stage. "
+            "DATA_WAREHOUSE has to point to a scratch PostgreSQL database and the default database to a scratch MySQL "
+            "database, because --build replaces the warehouse tables and the run reloads the MyLA tables.")
+
+    def add_arguments(self, parser):
+        default = warehouse_simulator.DEFAULT_SCALE
+        parser.add_argument('--build', dest='build', action='store_true',
+                            help='(re)generate the simulated warehouse and add its courses before the run')
+        parser.add_argument('--courses', dest='courses', type=int, default=default.courses)
+        parser.add_argument('--enrollments', dest='enrollments', type=int, default=default.enrollments)
+        parser.add_argument('--submissions', dest='submissions', type=int, default=default.submissions)
+        parser.add_argument('--assignments-per-course', dest='assignments_per_course', type=int,
+                            default=default.assignments_per_course)
+        parser.add_argument('--groups-per-course', dest='groups_per_course', type=int,
+                            default=default.groups_per_course)
+        parser.add_argument('--files-per-course', dest='files_per_course', type=int, default=default.files_per_course)
+        parser.add_argument('--access-events-per-course', dest='access_events_per_course', type=int,
+                            default=default.access_events_per_course)
+
+    def handle(self, *args, **options):
+        scale = warehouse_simulator.WarehouseScale(**{field: options.get(field)
+                                                      for field in warehouse_simulator.WarehouseScale._fields})
+
+        if options.get('build'):
+            warehouse_engine = get_engine('DATA_WAREHOUSE')
+            if warehouse_engine.dialect.name != 'postgresql':
+                raise CommandError("The simulated warehouse needs a PostgreSQL DATA_WAREHOUSE database, "
+                                   f"not {warehouse_engine.dialect.name}.")
+            self.stdout.write(f"Building the simulated warehouse: {scale}")
+            build_start = time.time()
+            connection = warehouse_engine.raw_connection()
+            try:
+                warehouse_simulator.build_warehouse(connection.cursor(), scale)
+                connection.commit()
+            finally:
+                connection.close()
+            course_ids = warehouse_simulator.get_simulated_course_ids(scale)
+            Course.objects.bulk_create([Course(id=course_id, canvas_id=course_id - course_ids[0] + 1,
+                                               name=f"Simulated Course {course_id - course_ids[0] + 1}")
+                                        for course_id in course_ids], ignore_conflicts=True)
+            self.stdout.write(f"Built in {time.time() - build_start:.1f}s")
+
+        SimulatedCronJob.scale = scale
+        with cron.hold_cron_lease() as lease_holder:
+            if lease_holder is None:
+                raise CommandError("Another cron run holds the cron lease.")
+            run_start = time.time()
+            status = SimulatedCronJob().run_cron()
+            run_seconds = time.time() - run_start
+        if isinstance(status, tuple):
+            raise CommandError(status[0])
+
+        # cron_run is rebound by every run, so it is read through the module
+        self.stdout.write(f"Run {cron.cron_run.run_id} took {run_seconds:.1f}s")
+        self.stdout.write(f"{'stage':<32} {'wall':>9} {'query':>9} {'extracted':>10} {'loaded':>10} {'peak MB':>9} "
+                          f"{'frame MB':>13}")
+        run_metrics = CronStageMetric.objects.filter(run_id=cron.cron_run.run_id, course_ids='')
+        for metric in run_metrics.order_by('started_at'):
+            peak_memory_string = f"{metric.peak_memory_mb:.0f}" if metric.peak_memory_mb is not None else "-"
+            self.stdout.write(f"{metric.stage:<32} {metric.wall_seconds:>9.1f} {metric.query_seconds:>9.1f} "
+                              f"{metric.rows_extracted:>10} {metric.rows_loaded:>10} {peak_memory_string:>9} "
+                              f"{metric.frame_mb_string:>13}")
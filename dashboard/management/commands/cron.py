@@ -0,0 +1,14 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from dashboard.cron import DashboardCronJob
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        # Adding a "--resume" flag skips the stages and course batches completed by the latest run that failed.
+        # Omitting the flag starts a new run, like runcrons.
+        parser.add_argument('--resume', dest='resume', action='store_true', required=False)
+
+    def handle(self, *args, **options):
+        DashboardCronJob.resume = options.get('resume')
+        call_command('runcrons', 'dashboard.cron.DashboardCronJob', force=True)
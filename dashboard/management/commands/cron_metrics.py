@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from dashboard.models import CronStageMetric
+from statistics import median
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', dest='runs', type=int, default=10,
+                            help='number of recent runs the latest run is compared with')
+        parser.add_argument('--threshold', dest='threshold', type=float, default=1.5,
+                            help='flag stages and course batches slower than this times their median wall time')
+
+    def handle(self, *args, **options):
+        runs = options.get('runs')
+        threshold = options.get('threshold')
+
+        run_ids = CronStageMetric.objects.get_recent_run_ids(runs + 1)
+        if not run_ids:
+            self.stdout.write("No cron metrics were recorded yet.")
+            return
+        latest_run_id = run_ids[0]
+        # wall times of every stage and course batch by run, the oldest run first. Failed runs of a stage are left
+        # out, since they stopped early
+        wall_times = {}
+        for metric in CronStageMetric.objects.filter(run_id__in=run_ids, status='succeeded').order_by('started_at'):
+            wall_times.setdefault((metric.stage, metric.course_ids), {})[metric.run_id] = metric.wall_seconds
+
+        self.stdout.write(f"Run {latest_run_id} compared with {len(run_ids) - 1} earlier run(s)")
+        self.stdout.write(f"{'stage':<32} {'wall':>9} {'median':>9} {'query':>9} {'extracted':>10} {'loaded':>10} "
+                          f"{'GB billed':>10} {'peak MB':>9} {'frame MB':>13} {'status':>9}  trend")
+        regressions = []
+        failures = []
+        for metric in CronStageMetric.objects.filter(run_id=latest_run_id).order_by('started_at'):
+            key = (metric.stage, metric.course_ids)
+            key_wall_times = wall_times.get(key, {})
+            earlier_wall_times = [key_wall_times[run_id] for run_id in reversed(run_ids[1:])
+                                  if run_id in key_wall_times]
+            median_wall_time = median(earlier_wall_times) if earlier_wall_times else None
+            if metric.status != 'succeeded':
+                failures.append(metric)
+            elif median_wall_time and metric.wall_seconds > threshold * median_wall_time:
+                regressions.append((metric, median_wall_time))
+
+            # course batches are only listed when they regressed
+            if metric.course_ids:
+                continue
+            trend = " ".join(f"{wall_time:.0f}" for wall_time in earlier_wall_times + [metric.wall_seconds])
+            median_string = f"{median_wall_time:.1f}" if median_wall_time is not None else "-"
+            peak_memory_string = f"{metric.peak_memory_mb:.0f}" if metric.peak_memory_mb is not None else "-"
+            self.stdout.write(f"{metric.stage:<32} {metric.wall_seconds:>9.1f} {median_string:>9} "
+                              f"{metric.query_seconds:>9.1f} {metric.rows_extracted:>10} {metric.rows_loaded:>10} "
+                              f"{metric.bytes_billed / 1024 / 1024 / 1024:>10.2f} {peak_memory_string:>9} "
+                              f"{metric.frame_mb_string:>13} {metric.status:>9}  {trend}")
+
+        for metric in failures:
+            course_ids = f" courses {metric.course_ids}" if metric.course_ids else ""
+            self.stdout.write(self.style.ERROR(f"Failed: {metric.stage}{course_ids} after {metric.wall_seconds:.1f}s"))
+        if not regressions:
+            if not failures:
+                self.stdout.write(self.style.SUCCESS(f"No stage or course batch is slower than {threshold} times "
+                                                     f"its median."))
+            return
+        for metric, median_wall_time in regressions:
+            course_ids = f" courses {metric.course_ids}" if metric.course_ids else ""
+            self.stdout.write(self.style.WARNING(
+                f"Regression: {metric.stage}{course_ids} took {metric.wall_seconds:.1f}s, "
+                f"{metric.wall_seconds / median_wall_time:.1f} times its median of {median_wall_time:.1f}s"))
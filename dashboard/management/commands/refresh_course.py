@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django_cron.models import CronJobLog
+from dashboard.common.db_util import COURSE_REFRESH_LOG_CODE, canvas_id_to_incremented_id
+from dashboard.cron import CronLeaseError, DashboardCronJob
+from dashboard.models import Course
+
+
+class Command(BaseCommand):
+    def add_arguments(self, parser):
+        # the Canvas course ids, like the course command
+        parser.add_argument('--course_id', dest='course_ids', type=int, nargs='+', required=True)
+
+    def handle(self, *args, **options):
+        course_ids = options.get('course_ids')
+
+        prefixed_course_ids = [canvas_id_to_incremented_id(course_id) for course_id in course_ids]
+        missing_course_ids = [course_id for course_id, prefixed_course_id in zip(course_ids, prefixed_course_ids)
+                              if not Course.objects.filter(id=prefixed_course_id).exists()]
+        if missing_course_ids:
+            raise CommandError(f"Course(s) {', '.join(map(str, missing_course_ids))} do not exist.")
+
+        # the result is logged like a cron run, so refreshes started from the course admin can be followed there
+        start_time = timezone.now()
+        try:
+            status = DashboardCronJob().refresh_courses(prefixed_course_ids)
+        except Exception as e:
+            CronJobLog.objects.create(code=COURSE_REFRESH_LOG_CODE, start_time=start_time, end_time=timezone.now(),
+                                      is_success=False,
+                                      message=f"Refreshing course(s) {', '.join(map(str, course_ids))} failed: {e}")
+            if isinstance(e, CronLeaseError):
+                raise CommandError(f"Course(s) {', '.join(map(str, course_ids))} were not refreshed, {e}.")
+            raise
+        CronJobLog.objects.create(code=COURSE_REFRESH_LOG_CODE, start_time=start_time, end_time=timezone.now(),
+                                  is_success=True, message=status)
+        self.stdout.write(status)
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0015_auto_20200116_1408'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronWatermark',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='Table Id')),
+                ('table_name', models.CharField(max_length=255, verbose_name='Table Name')),
+                ('course_id', models.BigIntegerField(verbose_name='Course Id')),
+                ('high_water_mark', models.DateTimeField(blank=True, null=True, verbose_name='High Water Mark')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'db_table': 'cron_watermark',
+                'unique_together': {('table_name', 'course_id')},
+            },
+        ),
+    ]
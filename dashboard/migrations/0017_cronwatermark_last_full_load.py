@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0016_cronwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cronwatermark',
+            name='last_full_load',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Last Full Load'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0017_cronwatermark_last_full_load'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronCheckpoint',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='Table Id')),
+                ('run_id', models.CharField(max_length=32, verbose_name='Run Id')),
+                ('stage', models.CharField(max_length=255, verbose_name='Stage')),
+                ('batch', models.CharField(blank=True, default='', max_length=40, verbose_name='Batch')),
+                ('completed_at', models.DateTimeField(auto_now_add=True, verbose_name='Completed At')),
+            ],
+            options={
+                'db_table': 'cron_checkpoint',
+                'unique_together': {('run_id', 'stage', 'batch')},
+            },
+        ),
+    ]
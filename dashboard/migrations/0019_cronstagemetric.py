@@ -0,0 +1,32 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0018_croncheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronStageMetric',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='Table Id')),
+                ('run_id', models.CharField(db_index=True, max_length=32, verbose_name='Run Id')),
+                ('stage', models.CharField(max_length=255, verbose_name='Stage')),
+                ('course_ids', models.TextField(blank=True, default='', verbose_name='Course Ids')),
+                ('started_at', models.DateTimeField(verbose_name='Started At')),
+                ('wall_seconds', models.FloatField(verbose_name='Wall Time (s)')),
+                ('query_seconds', models.FloatField(default=0, verbose_name='Query Time (s)')),
+                ('rows_extracted', models.BigIntegerField(default=0, verbose_name='Rows Extracted')),
+                ('rows_loaded', models.BigIntegerField(default=0, verbose_name='Rows Loaded')),
+                ('bytes_billed', models.BigIntegerField(default=0, verbose_name='BigQuery Bytes Billed')),
+                ('peak_memory_mb', models.FloatField(blank=True, null=True, verbose_name='Peak Memory (MB)')),
+            ],
+            options={
+                'db_table': 'cron_stage_metric',
+            },
+        ),
+    ]
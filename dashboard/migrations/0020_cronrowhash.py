@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0019_cronstagemetric'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronRowHash',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='Table Id')),
+                ('table_name', models.CharField(max_length=255, verbose_name='Table Name')),
+                ('row_key', models.CharField(max_length=255, verbose_name='Row Key')),
+                ('row_hash', models.CharField(max_length=16, verbose_name='Row Hash')),
+            ],
+            options={
+                'db_table': 'cron_row_hash',
+                'unique_together': {('table_name', 'row_key')},
+            },
+        ),
+    ]
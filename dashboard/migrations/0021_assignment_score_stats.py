@@ -0,0 +1,34 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0020_cronrowhash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssignmentScoreStats',
+            fields=[
+                ('assignment_id', models.BigIntegerField(primary_key=True, serialize=False,
+                                                         verbose_name='Assignment Id')),
+                ('course_id', models.BigIntegerField(db_index=True, verbose_name='Course Id')),
+                ('count', models.IntegerField(verbose_name='Scored Submissions')),
+                ('mean', models.FloatField(blank=True, null=True, verbose_name='Average Grade')),
+                ('median', models.FloatField(blank=True, null=True, verbose_name='Median Grade')),
+                ('first_quartile', models.FloatField(blank=True, null=True, verbose_name='First Quartile')),
+                ('third_quartile', models.FloatField(blank=True, null=True, verbose_name='Third Quartile')),
+                ('histogram', models.TextField(blank=True, null=True, verbose_name='Score Histogram')),
+            ],
+            options={
+                'db_table': 'assignment_score_stats',
+            },
+        ),
+        migrations.RemoveField(
+            model_name='submission',
+            name='avg_score',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0021_assignment_score_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cronstagemetric',
+            name='compact_frame_bytes',
+            field=models.BigIntegerField(default=0, verbose_name='Compact DataFrame Bytes'),
+        ),
+        migrations.AddField(
+            model_name='cronstagemetric',
+            name='frame_bytes',
+            field=models.BigIntegerField(default=0, verbose_name='DataFrame Bytes'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0022_cronstagemetric_frame_bytes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronLease',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='Table Id')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Name')),
+                ('holder', models.CharField(max_length=255, verbose_name='Holder')),
+                ('acquired_at', models.DateTimeField(verbose_name='Acquired At')),
+                ('expires_at', models.DateTimeField(verbose_name='Expires At')),
+            ],
+            options={
+                'db_table': 'cron_lease',
+            },
+        ),
+    ]
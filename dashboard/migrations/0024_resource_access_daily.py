@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0023_cron_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceAccessDaily',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='Table Id')),
+                ('course_id', models.BigIntegerField(verbose_name='Course Id')),
+                ('resource_id', models.CharField(max_length=255, verbose_name='Resource Id')),
+                ('user_id', models.BigIntegerField(db_index=True, verbose_name='User Id')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('access_count', models.IntegerField(verbose_name='Access Count')),
+                ('last_access_time', models.DateTimeField(verbose_name='Last Access Time')),
+            ],
+            options={
+                'db_table': 'resource_access_daily',
+                'unique_together': {('course_id', 'resource_id', 'user_id', 'day')},
+                'index_together': {('course_id', 'day')},
+            },
+        ),
+        # roll up the events already loaded, so incremental cron runs add to complete daily counts. resource_access has
+        # no course_id, so the events take the course of their resource, joined on the distinct (resource_id, course_id)
+        # pairs so resource rows repeated in a course do not multiply the counts
+        migrations.RunSQL(
+            """insert into resource_access_daily (course_id, resource_id, user_id, day, access_count, last_access_time)
+               select r.course_id, a.resource_id, a.user_id, date(a.access_time), count(*), max(a.access_time)
+               from resource_access a
+               join (select distinct resource_id, course_id from resource) r on a.resource_id = r.resource_id
+               group by r.course_id, a.resource_id, a.user_id, date(a.access_time)""",
+            migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0024_resource_access_daily'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cronstagemetric',
+            name='status',
+            field=models.CharField(default='succeeded', max_length=16, verbose_name='Status'),
+        ),
+    ]
@@ -7,7 +7,7 @@
 # Feel free to rename the models, but don't rename db_table values or field names.
 from __future__ import unicode_literals
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.db.models import Q
 
 from django.conf import settings
@@ -299,7 +299,6 @@ class Submission(models.Model):
     graded_date = models.DateTimeField(blank=True, null=True, verbose_name="Graded DateTime")
     # This is used for tracking of grade posted date and not used in Assignment view hence making it CharField
     grade_posted_local_date = models.CharField(max_length=255,blank=True, null=True, verbose_name="Posted Grade in local DateTime")
-    avg_score = models.FloatField(blank=True, null=True, verbose_name="Average Grade")
 
     def __str__(self):
         return f"Submission Id {self.id} for assignment id {self.assignment_id} for course id {self.course_id} for user id {self.user_id}"
@@ -308,6 +307,26 @@ class Meta:
         db_table = 'submission'
 
 
+# statistics of the submission scores of an assignment, computed by the cron job after loading the submissions
+class AssignmentScoreStats(models.Model):
+    assignment_id = models.BigIntegerField(primary_key=True, verbose_name="Assignment Id")
+    course_id = models.BigIntegerField(db_index=True, verbose_name="Course Id")
+    count = models.IntegerField(verbose_name="Scored Submissions")
+    mean = models.FloatField(blank=True, null=True, verbose_name="Average Grade")
+    median = models.FloatField(blank=True, null=True, verbose_name="Median Grade")
+    first_quartile = models.FloatField(blank=True, null=True, verbose_name="First Quartile")
+    third_quartile = models.FloatField(blank=True, null=True, verbose_name="Third Quartile")
+    # JSON object with the "bin_edges" and "counts" of a histogram of the scores
+    histogram = models.TextField(blank=True, null=True, verbose_name="Score Histogram")
+
+    def __str__(self):
+        return (f"Score statistics of {self.count} submissions for assignment id {self.assignment_id} "
+                f"for course id {self.course_id}")
+
+    class Meta:
+        db_table = 'assignment_score_stats'
+
+
 class UnizinMetadata(models.Model):
     pkey = models.CharField(primary_key=True, max_length=20, verbose_name="Key")
     pvalue = models.CharField(max_length=100, blank=True, null=True, verbose_name="Value")
@@ -367,3 +386,243 @@ def __str__(self):
 
     class Meta:
         db_table = 'resource_access'
+
+
+class ResourceAccessDaily(models.Model):
+    id = models.AutoField(primary_key=True, verbose_name="Table Id")
+    course_id = models.BigIntegerField(verbose_name="Course Id")
+    resource_id = models.CharField(max_length=255, verbose_name='Resource Id')
+    user_id = models.BigIntegerField(db_index=True, verbose_name='User Id')
+    # the UTC day of the accesses
+    day = models.DateField(verbose_name="Day")
+    access_count = models.IntegerField(verbose_name="Access Count")
+    last_access_time = models.DateTimeField(verbose_name="Last Access Time")
+
+    def __str__(self):
+        return f"Resource {self.resource_id} accessed {self.access_count} times by {self.user_id} on {self.day}"
+
+    class Meta:
+        db_table = 'resource_access_daily'
+        unique_together = (('course_id', 'resource_id', 'user_id', 'day'),)
+        index_together = (('course_id', 'day'),)
+
+
+class CronWatermarkQuerySet(models.QuerySet):
+    def get_watermark(self, table_name, course_id):
+        try:
+            return self.get(table_name=table_name, course_id=course_id).high_water_mark
+        except self.model.DoesNotExist:
+            logger.debug(f"No high-water mark for table {table_name} in course {course_id}")
+            return None
+
+    def set_watermark(self, table_name, course_id, high_water_mark, full_load_time=None):
+        defaults = {'high_water_mark': high_water_mark}
+        if full_load_time is not None:
+            defaults['last_full_load'] = full_load_time
+        return self.update_or_create(table_name=table_name, course_id=course_id, defaults=defaults)
+
+    def get_last_full_load(self, table_name):
+        """Returns the oldest full load time recorded for the table, or None if it was never fully loaded
+
+        :param table_name: name of the table being loaded
+        :type table_name: str
+        :rtype: datetime
+        """
+        return self.filter(table_name=table_name).aggregate(models.Min('last_full_load'))['last_full_load__min']
+
+
+class CronWatermark(models.Model):
+    id = models.AutoField(primary_key=True, verbose_name="Table Id")
+    table_name = models.CharField(max_length=255, verbose_name="Table Name")
+    course_id = models.BigIntegerField(verbose_name="Course Id")
+    high_water_mark = models.DateTimeField(blank=True, null=True, verbose_name="High Water Mark")
+    last_full_load = models.DateTimeField(blank=True, null=True, verbose_name="Last Full Load")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
+
+    objects = CronWatermarkQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.table_name} for course {self.course_id} loaded up to {self.high_water_mark}"
+
+    class Meta:
+        db_table = 'cron_watermark'
+        unique_together = (('table_name', 'course_id'),)
+
+
+class CronCheckpointQuerySet(models.QuerySet):
+    # stage recorded when a run completes
+    RUN_COMPLETED = 'run'
+
+    def is_completed(self, run_id, stage, batch=''):
+        return self.filter(run_id=run_id, stage=stage, batch=batch).exists()
+
+    def mark_completed(self, run_id, stage, batch=''):
+        return self.get_or_create(run_id=run_id, stage=stage, batch=batch)
+
+    def has_batches(self, run_id, stage):
+        return self.filter(run_id=run_id, stage=stage).exclude(batch='').exists()
+
+    def clear_batches(self, run_id, stage):
+        return self.filter(run_id=run_id, stage=stage).exclude(batch='').delete()
+
+    def get_unfinished_run_id(self):
+        """Returns the run id of the latest run that did not complete, or None if the latest run completed
+
+        :rtype: str
+        """
+        latest_checkpoint = self.order_by('-completed_at', '-id').first()
+        if latest_checkpoint is None or self.is_completed(latest_checkpoint.run_id, self.RUN_COMPLETED):
+            return None
+        return latest_checkpoint.run_id
+
+    def finish_run(self, run_id):
+        """Marks the run as completed and removes the checkpoints of earlier runs
+
+        :param run_id: id of the completed run
+        :type run_id: str
+        """
+        self.exclude(run_id=run_id).delete()
+        return self.mark_completed(run_id, self.RUN_COMPLETED)
+
+
+class CronCheckpoint(models.Model):
+    id = models.AutoField(primary_key=True, verbose_name="Table Id")
+    run_id = models.CharField(max_length=32, verbose_name="Run Id")
+    stage = models.CharField(max_length=255, verbose_name="Stage")
+    # a hash of the course ids of a batch, empty for a whole stage
+    batch = models.CharField(max_length=40, blank=True, default='', verbose_name="Batch")
+    completed_at = models.DateTimeField(auto_now_add=True, verbose_name="Completed At")
+
+    objects = CronCheckpointQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.stage} {self.batch} completed in run {self.run_id}"
+
+    class Meta:
+        db_table = 'cron_checkpoint'
+        unique_together = (('run_id', 'stage', 'batch'),)
+
+
+class CronStageMetricQuerySet(models.QuerySet):
+    def get_recent_run_ids(self, count):
+        """Returns the ids of the latest runs with metrics, the most recent first
+
+        :param count: number of runs
+        :type count: int
+        :rtype: list
+        """
+        return list(self.values('run_id').annotate(run_started_at=models.Min('started_at'))
+                    .order_by('-run_started_at').values_list('run_id', flat=True)[:count])
+
+
+class CronStageMetric(models.Model):
+    id = models.AutoField(primary_key=True, verbose_name="Table Id")
+    run_id = models.CharField(max_length=32, db_index=True, verbose_name="Run Id")
+    stage = models.CharField(max_length=255, verbose_name="Stage")
+    # the course ids of a batch, empty for a whole stage
+    course_ids = models.TextField(blank=True, default='', verbose_name="Course Ids")
+    started_at = models.DateTimeField(verbose_name="Started At")
+    wall_seconds = models.FloatField(verbose_name="Wall Time (s)")
+    query_seconds = models.FloatField(default=0, verbose_name="Query Time (s)")
+    rows_extracted = models.BigIntegerField(default=0, verbose_name="Rows Extracted")
+    rows_loaded = models.BigIntegerField(default=0, verbose_name="Rows Loaded")
+    bytes_billed = models.BigIntegerField(default=0, verbose_name="BigQuery Bytes Billed")
+    # memory of the extracted DataFrames before and after CRON_COMPACT_DTYPES, summed over the stage or batch
+    frame_bytes = models.BigIntegerField(default=0, verbose_name="DataFrame Bytes")
+    compact_frame_bytes = models.BigIntegerField(default=0, verbose_name="Compact DataFrame Bytes")
+    # the highest resident memory of the process sampled while the stage or batch ran, None where it cannot be read
+    peak_memory_mb = models.FloatField(blank=True, null=True, verbose_name="Peak Memory (MB)")
+    # succeeded, or failed when the stage or batch raised an exception
+    status = models.CharField(max_length=16, default='succeeded', verbose_name="Status")
+
+    objects = CronStageMetricQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.stage} {self.course_ids} took {self.wall_seconds}s in run {self.run_id}"
+
+    # the DataFrame memory in MB before and after compacting, for the metric reports
+    @property
+    def frame_mb_string(self):
+        if not self.frame_bytes:
+            return "-"
+        return f"{self.frame_bytes / 1024 / 1024:.0f}->{self.compact_frame_bytes / 1024 / 1024:.0f}"
+
+    class Meta:
+        db_table = 'cron_stage_metric'
+
+
+class CronRowHashQuerySet(models.QuerySet):
+    def get_row_hashes(self, table_name):
+        """Returns the hashes stored for the rows of the table, by row key
+
+        :param table_name: name of the table
+        :type table_name: str
+        :rtype: dict
+        """
+        return dict(self.filter(table_name=table_name).values_list('row_key', 'row_hash').iterator())
+
+
+class CronRowHash(models.Model):
+    id = models.AutoField(primary_key=True, verbose_name="Table Id")
+    table_name = models.CharField(max_length=255, verbose_name="Table Name")
+    row_key = models.CharField(max_length=255, verbose_name="Row Key")
+    row_hash = models.CharField(max_length=16, verbose_name="Row Hash")
+
+    objects = CronRowHashQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.table_name} row {self.row_key} hashed {self.row_hash}"
+
+    class Meta:
+        db_table = 'cron_row_hash'
+        unique_together = (('table_name', 'row_key'),)
+
+
+class CronLeaseQuerySet(models.QuerySet):
+    def acquire(self, name, holder, duration):
+        """Takes the lease for the holder when nobody holds it or the lease of its holder expired
+
+        :param name: name of the lease
+        :type name: str
+        :param holder: id of the process taking the lease
+        :type holder: str
+        :param duration: seconds until the lease expires unless it is renewed
+        :type duration: int
+        :return: whether the holder has the lease
+        :rtype: bool
+        """
+        now = datetime.now(pytz.UTC)
+        expires_at = now + timedelta(seconds=duration)
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(name=name, holder=holder, acquired_at=now, expires_at=expires_at)
+            return True
+        except IntegrityError:
+            # the update is conditional, so of two processes taking over an expired lease only one succeeds
+            return self.filter(Q(expires_at__lt=now) | Q(holder=holder), name=name).update(
+                holder=holder, acquired_at=now, expires_at=expires_at) == 1
+
+    def renew(self, name, holder, duration):
+        """Extends the lease of the holder, returning False when the holder lost the lease"""
+        return self.filter(name=name, holder=holder).update(
+            expires_at=datetime.now(pytz.UTC) + timedelta(seconds=duration)) == 1
+
+    def release(self, name, holder):
+        return self.filter(name=name, holder=holder).delete()
+
+
+class CronLease(models.Model):
+    id = models.AutoField(primary_key=True, verbose_name="Table Id")
+    name = models.CharField(max_length=255, unique=True, verbose_name="Name")
+    # host, process id and a random suffix of the process holding the lease
+    holder = models.CharField(max_length=255, verbose_name="Holder")
+    acquired_at = models.DateTimeField(verbose_name="Acquired At")
+    expires_at = models.DateTimeField(verbose_name="Expires At")
+
+    objects = CronLeaseQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.name} held by {self.holder} until {self.expires_at}"
+
+    class Meta:
+        db_table = 'cron_lease'
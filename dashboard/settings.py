@@ -449,8 +449,82 @@ def show_debug_toolbar(request):
 
 CLIENT_CACHE_TIME = ENV.get("CLIENT_CACHE_TIME", 3600)
 
+# Connections kept open in each pool of the SQLAlchemy engines shared by the cron job and the views
+DB_POOL_SIZE = ENV.get("DB_POOL_SIZE", 5)
+
+# Test pooled connections with a ping before using them, replacing the ones the database closed
+DB_POOL_PRE_PING = ENV.get("DB_POOL_PRE_PING", True)
+
+# Seconds after which pooled connections are replaced, to stay under the server's wait_timeout (-1 keeps them)
+DB_POOL_RECYCLE = ENV.get("DB_POOL_RECYCLE", 3600)
+
 CRON_BQ_IN_LIMIT = ENV.get("CRON_BQ_IN_LIMIT", 20)
 
+# How many course ids to pass to each data warehouse query in the per-course cron stages
+CRON_DW_IN_LIMIT = ENV.get("CRON_DW_IN_LIMIT", CRON_BQ_IN_LIMIT)
+
+# How many course batches the cron extracts from the data warehouse at the same time
+CRON_MAX_WORKERS = ENV.get("CRON_MAX_WORKERS", 1)
+
+# How many cron stages that do not depend on each other run at the same time (1 runs them one at a time in order)
+CRON_STAGE_WORKERS = ENV.get("CRON_STAGE_WORKERS", 1)
+
+# Reload tables into shadow copies that are swapped in atomically, so the dashboards never see empty tables
+CRON_USE_SHADOW_TABLES = ENV.get("CRON_USE_SHADOW_TABLES", False)
+
+# Tables cron reloads by diffing row hashes with the previous run, writing only the rows that changed
+CRON_ROW_HASH_TABLES = ENV.get("CRON_ROW_HASH_TABLES", [])
+
+# Rows per chunk when streaming data warehouse extracts through a server-side cursor (0 reads each extract at once)
+CRON_STREAM_CHUNK_SIZE = ENV.get("CRON_STREAM_CHUNK_SIZE", 0)
+
+# How cron writes DataFrames to MySQL: "to_sql" for multi-row INSERTs or "load_data" for LOAD DATA LOCAL INFILE
+CRON_LOAD_BACKEND = ENV.get("CRON_LOAD_BACKEND", "to_sql")
+
+# Download BigQuery results through the BigQuery Storage API instead of the REST pager
+CRON_BQ_STORAGE_API = ENV.get("CRON_BQ_STORAGE_API", False)
+
+# Directory the cron extracts are staged in as Parquet files, one sub-directory per day and stage ("" turns staging off)
+CRON_STAGING_DIR = ENV.get("CRON_STAGING_DIR", "")
+
+# Staged day (YYYY-MM-DD) loaded by DashboardReplayCronJob, the latest one when empty
+CRON_REPLAY_DATE = ENV.get("CRON_REPLAY_DATE", "")
+
+# Load only the rows changed since the last cron run instead of deleting and reloading tables. Assignments are
+# changed by assignment_dim.updated_at, so changes only made to assignment_fact (such as points_possible) are loaded
+# when the course is refreshed
+CRON_INCREMENTAL = ENV.get("CRON_INCREMENTAL", False)
+
+# With CRON_INCREMENTAL, days between full reloads of resource_access from BigQuery (0 reloads on every run)
+CRON_BQ_FULL_RELOAD_DAYS = ENV.get("CRON_BQ_FULL_RELOAD_DAYS", 7)
+
+# Keep every BigQuery access event in resource_access besides the resource_access_daily rollup the views read
+RESOURCE_ACCESS_KEEP_RAW = ENV.get("RESOURCE_ACCESS_KEEP_RAW", True)
+
+# Seconds the cron lease is valid without a heartbeat. A cron run, course refresh or replay only starts while it holds
+# the lease, and another cron pod takes the lease over once it expired
+CRON_LEASE_SECONDS = ENV.get("CRON_LEASE_SECONDS", 300)
+
+# Seconds between the heartbeats renewing the cron lease while a run holds it
+CRON_LEASE_HEARTBEAT_SECONDS = ENV.get("CRON_LEASE_HEARTBEAT_SECONDS", 60)
+
+# Give cron extracts compact column types (categories, downcast integers, parsed timestamps) to use less memory
+CRON_COMPACT_DTYPES = ENV.get("CRON_COMPACT_DTYPES", False)
+
+# How many BigQuery course batches are queried and downloaded at the same time
+CRON_BQ_MAX_CONCURRENT_JOBS = ENV.get("CRON_BQ_MAX_CONCURRENT_JOBS", 1)
+
+# Access events per BigQuery course batch, estimated from each course's previous load
+# (0 batches by CRON_BQ_IN_LIMIT only)
+CRON_BQ_BATCH_EVENT_LIMIT = ENV.get("CRON_BQ_BATCH_EVENT_LIMIT", 2000000)
+
+# Bytes each BigQuery job of the cron may bill (0 for no cap). Batches estimated over the cap by a dry run are queried
+# in narrower time windows, or fail when narrower windows are not estimated under it
+CRON_BQ_MAX_BYTES_BILLED = ENV.get("CRON_BQ_MAX_BYTES_BILLED", 0)
+
+# BigQuery on-demand price in USD per TB, for the cost reported by the cron
+CRON_BQ_PRICE_PER_TB = ENV.get("CRON_BQ_PRICE_PER_TB", 5)
+
 CANVAS_FILE_PREFIX = ENV.get("CANVAS_FILE_PREFIX", "")
 CANVAS_FILE_POSTFIX = ENV.get("CANVAS_FILE_POSTFIX", "")
 
@@ -9,12 +9,11 @@
 import pandas as pd
 from django.conf import settings
 from django.contrib import auth
-from django.db import connection as conn
 from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import redirect, render
 from pinax.eventlog.models import log as eventlog
 from dashboard.event_logs_types.event_logs_types import EventLogTypes
-from dashboard.common.db_util import canvas_id_to_incremented_id
+from dashboard.common.db_util import canvas_id_to_incremented_id, get_engine
 from dashboard.common import utils
 from django.core.exceptions import ObjectDoesNotExist
 from collections import namedtuple
@@ -165,7 +164,7 @@ def resource_access_within_week(request, course_id=0):
     elif (grade == GRADE_C):
         total_number_student_sql += " and current_grade >= 70 and current_grade < 80"
 
-    total_number_student_df = pd.read_sql(total_number_student_sql, conn, params={"course_id": course_id})
+    total_number_student_df = pd.read_sql(total_number_student_sql, get_engine(), params={"course_id": course_id})
     total_number_student = total_number_student_df.iloc[0,0]
     logger.info(f"course_id {course_id} total student={total_number_student}")
     if total_number_student == 0:
@@ -179,22 +178,25 @@ def resource_access_within_week(request, course_id=0):
     logger.debug("course_start=" + str(course_date_start) + " start=" + str(start) + " end=" + str(end))
 
     # get time range based on week number passed in via request
+    # the accesses are read from the daily rollup, by the (UTC) days from the start day up to the end day
 
     sqlString = f"""SELECT a.resource_id as resource_id, r.resource_type as resource_type, r.name as resource_name, u.current_grade as current_grade, a.user_id as user_id
-                    FROM resource r, resource_access a, user u, course c, academic_terms t
+                    FROM resource r, resource_access_daily a, user u, course c, academic_terms t
                     WHERE a.resource_id = r.resource_id and a.user_id = u.user_id
                     and r.course_id = c.id and c.term_id = t.id
-                    and a.access_time > %(start_time)s
-                    and a.access_time < %(end_time)s
+                    and a.day >= %(start_day)s
+                    and a.day < %(end_day)s
+                    and a.course_id = %(course_id)s
                     and r.course_id = %(course_id)s
                     and u.course_id = %(course_id)s
                     and u.enrollment_type = 'StudentEnrollment' """
 
-    startTimeString = start.strftime('%Y%m%d') + "000000"
-    endTimeString = end.strftime('%Y%m%d') + "000000"
+    startDayString = start.strftime('%Y-%m-%d')
+    endDayString = end.strftime('%Y-%m-%d')
     logger.debug(sqlString)
-    logger.debug("start time=" + startTimeString + " end_time=" + endTimeString)
-    df = pd.read_sql(sqlString, conn, params={"start_time": startTimeString,"end_time": endTimeString, "course_id": course_id})
+    logger.debug("start day=" + startDayString + " end day=" + endDayString)
+    df = pd.read_sql(sqlString, get_engine(),
+                     params={"start_day": startDayString, "end_day": endDayString, "course_id": course_id})
     logger.debug(df)
 
     # return if there is no data during this interval
@@ -237,8 +239,10 @@ def resource_access_within_week(request, course_id=0):
 
     # now insert person's own viewing records: what resources the user has viewed, and the last access timestamp
     # now insert person's own viewing records: what resources the user has viewed, and the last access timestamp
-    selfSqlString = "select CONCAT(r.resource_id, ';', r.name) as resource_id_name, count(*) as self_access_count, max(a.access_time) as self_access_last_time " \
-                    "from resource_access a, user u, resource r " \
+    selfSqlString = "select CONCAT(r.resource_id, ';', r.name) as resource_id_name, " \
+                    "cast(sum(a.access_count) as signed) as self_access_count, " \
+                    "max(a.last_access_time) as self_access_last_time " \
+                    "from resource_access_daily a, user u, resource r " \
                     "where a.user_id = u.user_id " \
                     "and a.resource_id = r.resource_id " \
                     "and u.sis_name=%(current_user)s " \
@@ -246,7 +250,7 @@ def resource_access_within_week(request, course_id=0):
     logger.debug(selfSqlString)
     logger.debug("current_user=" + current_user)
 
-    selfDf= pd.read_sql(selfSqlString, conn, params={"current_user":current_user})
+    selfDf= pd.read_sql(selfSqlString, get_engine(), params={"current_user":current_user})
 
     output_df = output_df.join(selfDf.set_index('resource_id_name'), on='resource_id_name', how='left')
     output_df["total_percent"] = output_df.apply(lambda row: row[GRADE_A] + row[GRADE_B] + row[GRADE_C] + row[GRADE_LOW] + row.NO_GRADE, axis=1)
@@ -309,7 +313,7 @@ def grade_distribution(request, course_id=0):
     (select current_grade from user where sis_name=%(current_user)s and course_id=%(course_id)s) as current_user_grade
         from user where course_id=%(course_id)s and enrollment_type='StudentEnrollment';
                     """
-    df = pd.read_sql(grade_score_sql, conn, params={"current_user": current_user, 'course_id': course_id})
+    df = pd.read_sql(grade_score_sql, get_engine(), params={"current_user": current_user, 'course_id': course_id})
     if df.empty or df.count().current_grade < 6:
         logger.info(f"Not enough students grades (only {df.count().current_grade}) in a course {course_id} to show the view")
         return HttpResponse(json.dumps({}), content_type='application/json')
@@ -509,10 +513,12 @@ def get_course_assignments(course_id):
             (select ifnull(assignment_id, 0) as assignment_id ,name,assign_grp_name,grp_id,due_date,points_possible,group_points,weight,drop_lowest,drop_highest from
             (select a.id as assignment_id,a.assignment_group_id, a.local_date as due_date,a.name,a.points_possible from assignment as a  where a.course_id =%(course_id)s) as app right join
             (select id, name as assign_grp_name, id as grp_id, group_points, weight,drop_lowest,drop_highest from assignment_groups where course_id=%(course_id)s) as ag on ag.id=app.assignment_group_id) as assign left join
-            (select distinct assignment_id,avg_score from submission where course_id=%(course_id)s) as sub on sub.assignment_id = assign.assignment_id
+            (select assignment_id, round(mean,1) as avg_score from assignment_score_stats
+            where course_id=%(course_id)s) as sub on sub.assignment_id = assign.assignment_id
             """
 
-    assignments_in_course = pd.read_sql(sql,conn,params={'course_id': course_id}, parse_dates={'due_date': '%Y-%m-%d'})
+    assignments_in_course = pd.read_sql(sql,get_engine(),params={'course_id': course_id},
+                                        parse_dates={'due_date': '%Y-%m-%d'})
     # No assignments found in the course
     if assignments_in_course.empty:
         logger.info('The course %s don\'t seems to have assignment data' % course_id)
@@ -546,7 +552,8 @@ def get_course_assignments(course_id):
 def get_user_assignment_submission(current_user,assignments_in_course_df, course_id):
     sql = "select assignment_id, score, graded_date from submission where " \
           "user_id=(select user_id from user where sis_name = %(current_user)s and course_id = %(course_id)s ) and course_id = %(course_id)s"
-    assignment_submissions = pd.read_sql(sql, conn, params={'course_id': course_id, "current_user": current_user})
+    assignment_submissions = pd.read_sql(sql, get_engine(),
+                                         params={'course_id': course_id, "current_user": current_user})
     if assignment_submissions.empty:
         logger.info('The user %s seems to be a not student in the course.' % current_user)
         # manually adding the columns for display in UI
@@ -615,7 +622,7 @@ def find_current_week(row):
 
 def is_weight_considered(course_id):
     url = "select consider_weight from assignment_weight_consideration where course_id=%(course_id)s"
-    df = pd.read_sql(url, conn, params={"course_id": course_id})
+    df = pd.read_sql(url, get_engine(), params={"course_id": course_id})
     value = df['consider_weight'].iloc[0]
     return value
 